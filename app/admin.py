@@ -1,8 +1,10 @@
 from django.contrib import admin
-from app.models import Tag, Question, Answer, Profile, Like
+from app.models import Tag, Question, Answer, Profile, Like, QuestionVote, AnswerVote
 
 admin.site.register(Tag)
 admin.site.register(Question)
 admin.site.register(Answer)
 admin.site.register(Profile)
-admin.site.register(Like)
\ No newline at end of file
+admin.site.register(Like)
+admin.site.register(QuestionVote)
+admin.site.register(AnswerVote)
\ No newline at end of file
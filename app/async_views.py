@@ -0,0 +1,235 @@
+"""
+Async versions of the busiest views, routed instead of app.views when
+serving through web_project/asgi.py (ASYNC_VIEWS). They render the same
+templates from the same queries; the queries that do not depend on each
+other are read at the same time.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
+
+from app import fragment_cache, page_cache, ranking, sidebar, views, vote_buffer
+from app.forms import AnswerForm
+from app.models import Answer, Profile, Question, Tag
+from app.page_cache import cached_page
+from app.paginator import CappedCountPaginator, CursorPaginator
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def query_executor():
+    # a connection per thread, kept for CONN_MAX_AGE: the pool size bounds
+    # what one process holds open on top of the request's own connection
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ASYNC_QUERY_THREADS', 4), thread_name_prefix='async-query'
+            )
+        return _executor
+
+
+def _on_own_connection(call):
+    def run():
+        try:
+            return call()
+        finally:
+            # closes only connections that are broken or past CONN_MAX_AGE
+            close_old_connections()
+    return run
+
+
+async def gather(*calls):
+    """
+    Runs blocking calls at the same time, returns their results in order.
+
+    Django's async ORM sends every query of a request through one thread
+    and connection, so asyncio.gather over aget()/acount() still queries
+    one after another. Here each call gets a pool thread with a connection
+    of its own from query_executor(), still counted by sql_metrics (the
+    request's context goes along). Those connections only see
+    committed rows: with ASYNC_PARALLEL_QUERIES off (work inside a
+    transaction, TestCase) the calls run in turn on the request's
+    connection instead.
+    """
+    if len(calls) == 1 or not getattr(settings, 'ASYNC_PARALLEL_QUERIES', True):
+        return [await sync_to_async(call)() for call in calls]
+    return await asyncio.gather(*(
+        sync_to_async(_on_own_connection(call), thread_sensitive=False, executor=query_executor())()
+        for call in calls
+    ))
+
+
+async def get_user(request):
+    user = await request.auser()
+    # on the request's connection: opening another costs more than the query
+    await sync_to_async(navbar_profile)(user)
+    # templates read request.user, which must not be loaded synchronously
+    request.user = user
+    return user
+
+
+def navbar_profile(user):
+    # cached on the user, so the template does not query for user.profile
+    if user.is_authenticated:
+        User.profile.related.set_cached_value(user, Profile.objects.filter(user=user).first())
+
+
+def page_number(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+async def load_page(request, queryset, *calls, per_page=5):
+    """
+    views.paginate for async views, read together with calls. In page
+    number mode the rows of the page and the capped count are read at the
+    same time. Returns (page, results of calls).
+    """
+    if views.use_cursor(request) and queryset.ordered:
+        paginator = CursorPaginator(queryset, per_page)
+        page, *results = await gather(partial(paginator.page, request.GET.get('cursor')), *calls)
+        return views.add_cursor_links(request, page), results
+
+    paginator = CappedCountPaginator(queryset, per_page)
+    number = page_number(request)
+    bottom = (number - 1) * per_page
+    rows, _, *results = await gather(
+        lambda: list(queryset[bottom:bottom + per_page]), lambda: paginator.count, *calls
+    )
+    if rows or number == 1:
+        return paginator._get_page(rows, number, paginator), results
+
+    # past the end: get_page falls back to the last page
+    page = await sync_to_async(paginator.get_page)(number)
+    page.object_list = await sync_to_async(list)(page.object_list)
+    return page, results
+
+
+def prepare(request, objects):
+    # the user's votes need the ids of the rows, so they come second
+    views.attach_votes(request, objects)
+    fragment_cache.attach_versions(objects)
+
+
+async def listing(request, template, questions):
+    await get_user(request)
+    page, (request.sidebar,) = await load_page(request, questions, sidebar.get)
+    await sync_to_async(prepare)(request, page.object_list)
+
+    return render(request, template, context={
+        'questions': page.object_list,
+        'page_obj': page,
+    })
+
+
+@cached_page(page_cache.LISTS)
+async def index(request):
+    return await listing(request, 'index.html', Question.objects.new().for_listing())
+
+
+@cached_page(page_cache.LISTS)
+async def hot_questions(request):
+    return await listing(request, 'hot_questions.html', Question.objects.hot().for_listing())
+
+
+@cached_page('tag:{pk}')
+async def tag(request, pk):
+    await get_user(request)
+    tag_item, request.sidebar = await gather(partial(Tag.objects.get_by_id, pk), sidebar.get)
+    if tag_item is None:
+        raise Http404("Tag does not exist")
+
+    page, _ = await load_page(request, Question.objects.tagged(tag_item).for_listing())
+    await sync_to_async(prepare)(request, page.object_list)
+
+    return render(request, 'tag.html', context={
+        'questions': page.object_list,
+        'page_obj': page,
+        'tag': tag_item,
+        'tags': [tag_item],
+    })
+
+
+@cached_page('question:{pk}')
+async def question(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        # answering stays in the synchronous view
+        return await sync_to_async(views.question)(request, pk)
+
+    await get_user(request)
+
+    # the validators of views.question, checked before anything is loaded
+    modified = await sync_to_async(views.question_modified)(request, pk)
+    if modified is not None:
+        etag = quote_etag(views.question_etag(request, pk))
+        last_modified = int(modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+    answers = Answer.objects.filter(question_id=pk).select_related('user').order_by('-rating', '-created_at', '-id')
+    page, (q, request.sidebar) = await load_page(
+        request, answers, partial(Question.objects.for_listing().filter(pk=pk).first), sidebar.get,
+    )
+    if q is None:
+        raise Http404("Question does not exist")
+    await sync_to_async(prepare)(request, [q, *page.object_list])
+
+    response = render(request, 'question.html', context={
+        'answers_cnt': q.answers_count,
+        'question': q,
+        'answers': page.object_list,
+        'page_obj': page,
+        'form': AnswerForm(),
+    })
+    if modified is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+@require_POST
+@login_required(login_url='login')
+async def vote(request):
+    parsed = views.parse_vote(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    model, object_id, val = parsed
+
+    user = await get_user(request)
+    # loaded by get_user; raises like request.user.profile in views.vote
+    profile = user.profile
+    try:
+        new_rating = await sync_to_async(views.save_vote)(profile, model, object_id, val)
+    except model.DoesNotExist:
+        raise Http404(f"{model.__name__} does not exist")
+
+    if not vote_buffer.enabled():
+        # views.voted, with the page purge and the hot score read at once
+        fragment_cache.bump(model(pk=object_id))
+        calls = [partial(page_cache.purge_voted, model, object_id)]
+        if model is Question:
+            calls.append(partial(ranking.update, object_id))
+        await gather(*calls)
+
+    return JsonResponse({
+        'new_rating': new_rating,
+        'user_vote': val
+    })
@@ -0,0 +1,176 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+SIZES = (48, 96, 192)
+
+# (extension, Pillow format, save options); the first one is offered to
+# browsers that accept it, the last one is the fallback <img>.
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+ORIGINALS_DIR = 'profile_pics'
+
+THUMBNAILS_DIR = 'profile_pics/thumbs'
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def hashed_name(data, filename):
+    ext = os.path.splitext(filename)[1].lower() or '.jpg'
+    return f'{ORIGINALS_DIR}/{content_hash(data)}{ext}'
+
+
+def is_hashed(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return len(stem) == 32 and all(c in '0123456789abcdef' for c in stem)
+
+
+def store_original(field_file):
+    """
+    Saves an uploaded file under the hash of its content and returns that
+    name. Identical uploads share one file: if the name is already stored
+    nothing is written.
+    """
+    field_file.open('rb')
+    data = field_file.read()
+    name = hashed_name(data, field_file.name)
+    if not field_file.storage.exists(name):
+        name = field_file.storage.save(name, ContentFile(data))
+    return name
+
+
+def thumbnail_name(avatar_name, size, ext):
+    # derived from the original's content hash, so a name never changes
+    # meaning and can be cached forever
+    stem = os.path.splitext(os.path.basename(avatar_name))[0]
+    return f'{THUMBNAILS_DIR}/{stem}-{size}.{ext}'
+
+
+def thumbnail_names(avatar_name):
+    return {
+        (size, ext): thumbnail_name(avatar_name, size, ext)
+        for size in SIZES for ext, _, _ in FORMATS
+    }
+
+
+def thumbnails_stored(storage, avatar_name):
+    # the largest fallback is written last
+    return storage.exists(thumbnail_name(avatar_name, SIZES[-1], FORMATS[-1][0]))
+
+
+def render_thumbnails(data):
+    """
+    Returns {(size, ext): bytes} for every size and format: a centred square
+    crop, EXIF rotation applied, transparency flattened onto white for JPEG.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        flat = image
+        if image.mode == 'RGBA':
+            flat = Image.new('RGB', image.size, 'white')
+            flat.paste(image, mask=image.getchannel('A'))
+
+        result = {}
+        for size in SIZES:
+            for ext, image_format, options in FORMATS:
+                source = image if image_format == 'WEBP' else flat
+                thumbnail = ImageOps.fit(source, (size, size), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, image_format, **options)
+                result[(size, ext)] = buffer.getvalue()
+        return result
+
+
+def process(profile):
+    """
+    Moves the avatar to its content-hashed name if it is not there yet,
+    writes the missing thumbnails and marks the profile. Safe to repeat.
+    """
+    storage = profile.avatar.storage
+    with profile.avatar.open('rb') as avatar:
+        data = avatar.read()
+
+    name = profile.avatar.name
+    if not is_hashed(name):
+        name = hashed_name(data, name)
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(data))
+
+    names = thumbnail_names(name)
+    missing = {key: path for key, path in names.items() if not storage.exists(path)}
+    if missing:
+        for key, content in render_thumbnails(data).items():
+            if key in missing:
+                storage.save(missing[key], ContentFile(content))
+
+    # a newer upload may have replaced this avatar meanwhile
+    type(profile).objects.filter(pk=profile.pk, avatar=profile.avatar.name).update(
+        avatar=name, has_avatar=True, avatar_thumbnails=True,
+    )
+    return name
+
+
+def process_profile(profile_id):
+    Profile = apps.get_model('app', 'Profile')
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.has_avatar:
+        return None
+    return process(profile)
+
+
+def _run(profile_id):
+    try:
+        process_profile(profile_id)
+    except Exception:
+        logger.exception('Avatar processing failed for profile %s', profile_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+                thread_name_prefix='avatars',
+            )
+        return _executor
+
+
+def schedule(profile_id):
+    """
+    Processes the profile's avatar in the worker pool, or right away when
+    AVATAR_WORKERS is 0.
+    """
+    if getattr(settings, 'AVATAR_WORKERS', 2) == 0:
+        return process_profile(profile_id)
+    get_executor().submit(_run, profile_id)
+
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=True)
@@ -0,0 +1,59 @@
+from django.db import connection, transaction
+
+
+def secondary_indexes(model):
+    """
+    (name, CREATE statement) of every plain index on the model's table. The
+    primary key and anything enforcing uniqueness are left out: dropping
+    those would let bad rows in, dropping the rest only costs lookups.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("""
+                SELECT i.relname, pg_get_indexdef(x.indexrelid)
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass AND NOT x.indisunique
+                ORDER BY i.relname
+            """, [table])
+        elif connection.vendor == 'sqlite':
+            # automatic indexes of inline UNIQUE constraints have no sql
+            cursor.execute("""
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'index' AND tbl_name = %s
+                  AND sql IS NOT NULL AND upper(sql) NOT LIKE 'CREATE UNIQUE%%'
+                ORDER BY name
+            """, [table])
+        else:
+            return []
+        return cursor.fetchall()
+
+
+def drop_indexes(models):
+    """
+    Drops the secondary indexes of the models' tables and returns the
+    statements that recreate them.
+    """
+    quote = connection.ops.quote_name
+    statements = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in models:
+            for name, create in secondary_indexes(model):
+                cursor.execute(f'DROP INDEX {quote(name)}')
+                statements.append(create)
+    return statements
+
+
+def create_index(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+def analyze(models):
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'ANALYZE {quote(model._meta.db_table)}')
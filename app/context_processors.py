@@ -0,0 +1,7 @@
+from app import sidebar as sidebar_aggregate
+
+
+def sidebar(request):
+    # async views read it ahead, together with their other queries
+    data = getattr(request, 'sidebar', None)
+    return data if data is not None else sidebar_aggregate.get()
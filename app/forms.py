@@ -1,6 +1,11 @@
+import re
+
 from django import forms
 from django.contrib import auth
 from django.contrib.auth.models import User
+from django.db import transaction
+from app import fragment_cache, page_cache, search
+from app.suggest import suggestions
 from app.models import Answer, Profile, Question, Tag
 
 
@@ -79,22 +84,41 @@ class QuestionForm(forms.ModelForm):
         if not raw_tags:
             return []
         
-        tag_names = [t.strip() for t in raw_tags.split() if t.strip()]
+        max_length = Tag._meta.get_field('name').max_length
+        tag_names = []
+        # commas separate tags in /tag/<names> URLs, so they separate them here
+        for name in re.split(r'[\s,]+', raw_tags.lower()):
+            if not name:
+                continue
+            if len(name) > max_length:
+                raise forms.ValidationError(f"Tag is longer than {max_length} characters.")
+            if name not in tag_names:
+                tag_names.append(name)
         return tag_names
 
     def save(self, user=None, commit=True):
         question = super().save(commit=False)
+        editing = question.pk is not None
         
         if user:
             question.user = user
             
         if commit:
-            question.save()
-            tag_names = self.cleaned_data.get('tags')
-            for name in tag_names:
-                tag, created = Tag.objects.get_or_create(name=name)
-                question.tags.add(tag)
-                
+            with transaction.atomic():
+                question.save()
+                tags, new_tags = Tag.objects.resolve(self.cleaned_data.get('tags'))
+                question.add_tags(tags)
+
+            transaction.on_commit(lambda: page_cache.purge_question(question.pk, [tag.pk for tag in tags]))
+            # the hot score is kept by the Question post_save signal
+            if editing:
+                transaction.on_commit(lambda: fragment_cache.bump(question))
+            else:
+                transaction.on_commit(lambda: suggestions.add_question(question))
+            transaction.on_commit(lambda: search.index_question(question))
+            if new_tags:
+                transaction.on_commit(lambda: suggestions.add_tags(new_tags))
+
         return question
 
 class AnswerForm(forms.ModelForm):
@@ -105,6 +129,25 @@ class AnswerForm(forms.ModelForm):
             'text': forms.Textarea(attrs={'class': 'answer_input', 'placeholder': 'Enter your answer here...'})
         }
 
+    def save(self, question=None, user=None, commit=True):
+        answer = super().save(commit=False)
+
+        if question:
+            answer.question = question
+        if user:
+            answer.user = user
+
+        if commit:
+            # Question.answers_count is bumped by the post_save signal,
+            # keep both writes in one transaction.
+            with transaction.atomic():
+                answer.save()
+                # the question card shows answers_count
+                transaction.on_commit(lambda: fragment_cache.bump(answer.question))
+                transaction.on_commit(lambda: page_cache.purge_question(answer.question_id))
+
+        return answer
+
 class SettingsForm(forms.ModelForm):
     avatar = forms.ImageField(required=False, widget=forms.FileInput())
     
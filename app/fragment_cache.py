@@ -0,0 +1,95 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300)
+
+
+def version_key(obj):
+    return f'fragment-version:{obj._meta.label_lower}:{obj.pk}'
+
+
+def initial_version():
+    # A fresh counter starts from the clock, so an evicted counter never
+    # comes back to a value an older fragment was stored under.
+    return time.time_ns() // 1000
+
+
+def attach_versions(objects):
+    """
+    Sets obj.fragment_version on every object with one get_many.
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+
+    cache = get_cache()
+    keys = {version_key(obj): obj for obj in objects}
+    found = cache.get_many(keys)
+    missing = {key: initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+
+    for key, obj in keys.items():
+        obj.fragment_version = found[key]
+    return objects
+
+
+def get_version(obj):
+    version = getattr(obj, 'fragment_version', None)
+    if version is None:
+        attach_versions([obj])
+        version = obj.fragment_version
+    return version
+
+
+def bump(*objects):
+    """
+    Invalidates every cached fragment of objects by moving their version.
+    """
+    cache = get_cache()
+    for obj in objects:
+        key = version_key(obj)
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            version = initial_version()
+            cache.set(key, version, timeout=None)
+        obj.fragment_version = version
+
+
+def fragment_key(obj, name, vary_on=()):
+    key = f'fragment:{name}:{obj._meta.label_lower}:{obj.pk}:{get_version(obj)}'
+    if vary_on:
+        digest = hashlib.md5(':'.join(str(v) for v in vary_on).encode()).hexdigest()
+        key = f'{key}:{digest}'
+    return key
+
+
+def record(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
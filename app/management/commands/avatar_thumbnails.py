@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app import avatars
+from app.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Move existing avatars to content-hash names and generate their thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--all', action='store_true',
+                            help='also redo profiles whose thumbnails are already marked as stored')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.filter(has_avatar=True).order_by('pk')
+        if not options['all']:
+            profiles = profiles.filter(avatar_thumbnails=False)
+
+        started = time.perf_counter()
+        done = failed = 0
+        executor = ThreadPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        try:
+            results = executor.map(self.process_in_thread, profiles.iterator()) if executor else map(self.process, profiles)
+            for profile, error in results:
+                if error is None:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'Profile {profile.pk} ({profile.avatar.name}): {error}')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Avatars processed: {done}, failed: {failed} in {time.perf_counter() - started:.1f} s'
+        ))
+
+    def process(self, profile):
+        try:
+            avatars.process(profile)
+            return profile, None
+        except Exception as error:
+            return profile, error
+
+    def process_in_thread(self, profile):
+        try:
+            return self.process(profile)
+        finally:
+            close_old_connections()
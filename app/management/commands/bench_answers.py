@@ -0,0 +1,68 @@
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Answer, Profile, Question
+
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Measure question page answer loading for growing answer counts (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--legacy', action='store_true',
+                            help='also load every answer and slice in Python, like the old prefetch')
+
+    def measure(self, func, repeat):
+        timings = []
+        peak = 0
+        for _ in range(repeat):
+            tracemalloc.start()
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        return statistics.median(timings), peak / 1024
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        user = User.objects.create_user('bench_answers_user')
+        profile = Profile.objects.create(user=user)
+
+        self.stdout.write(f'{"answers":>8} {"mode":>7} {"median ms":>10} {"peak KiB":>10}')
+        for size in options['sizes']:
+            question = Question.objects.create(title='bench', text='bench', user=user)
+            Answer.objects.bulk_create(
+                [Answer(question=question, text=f'answer {i}', user=profile, rating=i % 50) for i in range(size)],
+                batch_size=1000,
+            )
+
+            def windowed():
+                list(Question.objects.get_with_answers(question.pk).answers_page)
+
+            def legacy():
+                answers = list(Answer.objects.filter(question=question).select_related('user').order_by('-rating', '-created_at'))
+                answers[:5]
+
+            runs = [('window', windowed)]
+            if options['legacy']:
+                runs.append(('legacy', legacy))
+            for mode, func in runs:
+                median, peak = self.measure(func, options['repeat'])
+                self.stdout.write(f'{size:>8} {mode:>7} {median:>10.2f} {peak:>10.1f}')
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from app import sidebar
+from app.management.commands.bench_endpoints import (
+    WSGIClient, login_headers, make_request, sample, summarize,
+)
+from app.models import Question, Tag
+
+
+ENDPOINTS = ['index', 'hot_questions', 'question', 'tag', 'vote']
+
+
+def inject_latency(query_delay, connect_delay):
+    """
+    Local stand-in for a slow or distant database: every query of this
+    process, and every new connection, waits first. The wait blocks the
+    calling thread like a network round trip would.
+    """
+    def delay(execute, sql, params, many, context):
+        time.sleep(query_delay)
+        return execute(sql, params, many, context)
+
+    def on_connect(sender, connection, **kwargs):
+        time.sleep(connect_delay)
+        # first in the list: connections are often opened inside an
+        # execute_wrapper() block, which pops the last wrapper on exit
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(on_connect, weak=False)
+    connections.close_all()
+
+
+class ASGIClient:
+    """
+    Calls the ASGI application from web_project/asgi.py directly.
+    """
+
+    def __init__(self):
+        from web_project.asgi import application
+        self.application = application
+
+    async def request(self, method, path, data=None, headers=None):
+        body = urlencode(data).encode() if data else b''
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+                *((name.lower().encode(), value.encode()) for name, value in (headers or {}).items()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        incoming = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        finished = asyncio.Event()
+        response = {'status': None, 'headers': {}, 'body': []}
+
+        async def receive():
+            if incoming:
+                return incoming.pop()
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode().lower(): value.decode() for name, value in message['headers']}
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+                if not message.get('more_body'):
+                    finished.set()
+
+        try:
+            await self.application(scope, receive, send)
+        finally:
+            finished.set()
+        return response['status'], response['headers'], b''.join(response['body'])
+
+
+class Command(BaseCommand):
+    help = 'Throughput of the sync (WSGI) and async (ASGI) views against a database with injected latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=20, help='ms added to every query')
+        parser.add_argument('--connect-latency', type=float, default=None,
+                            help='ms added to every new connection (default: --latency)')
+        parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=16, help='clients sending at the same time')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='sync workers the WSGI side gets, as gunicorn_config.workers')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--child', choices=['wsgi', 'asgi'], help='internal: run one side in this process')
+
+    def handle(self, *args, **options):
+        endpoints = [name for name in options['endpoints'].split(',') if name]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+
+        if options['child']:
+            results = self.run_side(options['child'], endpoints, options)
+            self.stdout.write(json.dumps(results))
+            return
+
+        # each side in a fresh process: ASYNC_VIEWS picks the routed views
+        # when the URLconf is first imported
+        results = {}
+        for side in ('wsgi', 'asgi'):
+            self.stdout.write(f'Running {side}...')
+            results[side] = self.spawn(side, options)
+
+        self.stdout.write(
+            f'\nlatency {options["latency"]:g} ms/query, {options["concurrency"]} clients, '
+            f'{options["workers"]} sync workers vs 1 async process'
+        )
+        self.stdout.write(
+            f'{"endpoint":<14} {"wsgi rps":>9} {"asgi rps":>9} {"speedup":>8} '
+            f'{"wsgi p95":>9} {"asgi p95":>9} {"errors":>8}'
+        )
+        for name in endpoints:
+            sync_row, async_row = results['wsgi'][name], results['asgi'][name]
+            speedup = async_row['rps'] / sync_row['rps'] if sync_row['rps'] and async_row['rps'] else None
+            self.stdout.write(
+                f'{name:<14} {fmt(sync_row["rps"], ".1f"):>9} {fmt(async_row["rps"], ".1f"):>9} '
+                f'{fmt(speedup, ".2f") + "x":>8} {fmt(sync_row["p95_ms"], ".0f"):>9} '
+                f'{fmt(async_row["p95_ms"], ".0f"):>9} {sync_row["errors"]:>3}/{async_row["errors"]:<4}'
+            )
+
+        if options['output']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in (
+                    'latency', 'connect_latency', 'requests', 'concurrency', 'workers'
+                )}, 'results': results}, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def spawn(self, side, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_async', '--child', side,
+            '--latency', str(options['latency']),
+            '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']),
+            '--workers', str(options['workers']),
+            '--warmup', str(options['warmup']),
+            '--endpoints', options['endpoints'],
+            '--seed', str(options['seed']),
+        ]
+        if options['connect_latency'] is not None:
+            command += ['--connect-latency', str(options['connect_latency'])]
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'web_project.settings'),
+            'ASYNC_VIEWS': '1' if side == 'asgi' else '0',
+        }
+        done = subprocess.run(command, env=env, capture_output=True, text=True)
+        if done.returncode:
+            raise CommandError(f'{side} run failed:\n{done.stderr[-2000:]}')
+        return json.loads(done.stdout.strip().splitlines()[-1])
+
+    def run_side(self, side, endpoints, options):
+        question_ids = list(Question.objects.values_list('pk', flat=True)[:10000])
+        tag_ids = list(Tag.objects.values_list('pk', flat=True)[:10000])
+        if not question_ids or not tag_ids:
+            raise CommandError('No questions or tags to request, seed the database with fill_db')
+        # page reads as a logged-in user, past the anonymous page cache
+        headers = login_headers()
+        # both sides start with the aggregates cached, as after the scheduler's first run
+        sidebar.refresh()
+
+        latency = options['latency'] / 1000
+        connect_latency = latency if options['connect_latency'] is None else options['connect_latency'] / 1000
+        inject_latency(latency, connect_latency)
+
+        rng = random.Random(options['seed'])
+        results = {}
+        for name in endpoints:
+            requests = [
+                make_request(rng, name, question_ids, tag_ids)
+                for _ in range(options['warmup'] + options['requests'])
+            ]
+            if side == 'wsgi':
+                results[name] = self.run_wsgi(requests, headers, options)
+            else:
+                results[name] = asyncio.run(self.run_asgi(requests, headers, options))
+        return results
+
+    def run_wsgi(self, requests, headers, options):
+        client = WSGIClient()
+        # a sync worker serves one request at a time: clients queue for one
+        workers = threading.BoundedSemaphore(options['workers'])
+
+        def send(request):
+            method, path, data, expected = request
+            started = time.perf_counter()
+            try:
+                with workers:
+                    response = client.request(method, path, data, headers)
+            except Exception:
+                return None, None
+            return sample(response, expected, time.perf_counter() - started)
+
+        warmup, measured = requests[:options['warmup']], requests[options['warmup']:]
+        for request in warmup:
+            send(request)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            samples = list(executor.map(send, measured))
+        return summarize(samples, time.perf_counter() - started)
+
+    async def run_asgi(self, requests, headers, options):
+        client = ASGIClient()
+
+        async def send(request):
+            method, path, data, expected = request
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, data, headers)
+            except Exception:
+                return None, None
+            return sample(response, expected, time.perf_counter() - started)
+
+        warmup, measured = requests[:options['warmup']], requests[options['warmup']:]
+        for request in warmup:
+            await send(request)
+
+        pending = iter(measured)
+        samples = []
+
+        async def client_loop():
+            for request in pending:
+                samples.append(await send(request))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(options['concurrency'])))
+        return summarize(samples, time.perf_counter() - started)
+
+
+def fmt(value, spec):
+    return format(value, spec) if value is not None else '-'
@@ -0,0 +1,96 @@
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.test.utils import override_settings
+
+from app.models import Profile
+
+
+TEMPLATE = '{% for p in profiles %}<img src="{{ p.avatar_url }}">{% endfor %}'
+
+
+class Rollback(Exception):
+    pass
+
+def legacy_avatar_url(profile):
+    # what Profile.avatar_url did before has_avatar was stored
+    if profile.avatar:
+        try:
+            if profile.avatar.storage.exists(profile.avatar.name):
+                return profile.avatar.url
+        except Exception:
+            pass
+    return static('images/silly_cat.jpg')
+
+class LegacyProfile:
+    def __init__(self, profile):
+        self.avatar = profile.avatar
+
+    @property
+    def avatar_url(self):
+        return legacy_avatar_url(self)
+
+class Command(BaseCommand):
+    help = 'Render cost of 100 avatars with per-render storage checks against the stored has_avatar flag (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--avatars', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help='added to every exists() call, e.g. to model a remote HEAD request')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            try:
+                with transaction.atomic():
+                    self.run(options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, options):
+        profiles = []
+        for i in range(options['avatars']):
+            profile = Profile(user=User.objects.create_user(f'bench_avatars_{i}'))
+            # every other profile has an uploaded avatar, the rest fall back
+            if i % 2 == 0:
+                profile.avatar.save(f'bench_{i}.jpg', ContentFile(b'avatar'), save=False)
+            profile.save()
+            profiles.append(profile)
+
+        storage = profiles[0].avatar.storage
+        exists = storage.exists
+        calls = 0
+
+        def counted_exists(name):
+            nonlocal calls
+            calls += 1
+            if options['latency_ms']:
+                time.sleep(options['latency_ms'] / 1000)
+            return exists(name)
+
+        storage.exists = counted_exists
+        try:
+            self.stdout.write(f'{"mode":>8} {"avatars":>8} {"exists()":>9} {"ms/render":>10}')
+            for mode, objects in (('legacy', [LegacyProfile(p) for p in profiles]), ('stored', profiles)):
+                calls = 0
+                median = self.measure(objects, options['repeat'])
+                self.stdout.write(f'{mode:>8} {len(objects):>8} {calls // options["repeat"]:>9} {median:>10.3f}')
+        finally:
+            del storage.exists
+
+    def measure(self, objects, repeat):
+        template = Template(TEMPLATE)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            template.render(Context({'profiles': objects}))
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,372 @@
+import http.client
+import io
+import json
+import os
+import random
+import re
+import secrets
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+
+from app.models import Profile, Question, Tag
+
+
+ENDPOINTS = ['index', 'hot_questions', 'question', 'tag', 'vote', 'ask']
+
+WRITES = {'vote', 'ask'}
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class WSGIClient:
+    """
+    Calls the WSGI application from web_project/wsgi.py directly, the way a
+    server would, middleware and request signals included.
+    """
+
+    def __init__(self):
+        from web_project.wsgi import application
+        self.application = application
+
+    def request(self, method, path, data=None, headers=None):
+        body = urlencode(data).encode() if data else b''
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': 'localhost',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in (headers or {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split()[0])
+            response['headers'] = {name.lower(): value for name, value in response_headers}
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+
+class HTTPClient:
+    """
+    The same interface over real HTTP, one keep-alive connection per thread.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+        self.opened = []
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.opened.append(conn)
+        return conn
+
+    def request(self, method, path, data=None, headers=None):
+        body = urlencode(data) if data else None
+        headers = {'Host': 'localhost', **(headers or {})}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, {k.lower(): v for k, v in response.getheaders()}, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed an idle keep-alive connection
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        for conn in self.opened:
+            conn.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def login_headers():
+    """
+    Cookie and CSRF headers of a logged-in bench user.
+    """
+    with transaction.atomic():
+        user = User.objects.filter(username='bench_endpoints').first()
+        if user is None:
+            user = User.objects.create_user('bench_endpoints')
+        Profile.objects.get_or_create(user=user)
+    client = Client()
+    client.force_login(user)
+    session = client.cookies[settings.SESSION_COOKIE_NAME].value
+    # an unmasked 32 character secret is accepted both as cookie and header
+    csrf = secrets.token_hex(16)
+    return {
+        'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf}',
+        'X-CSRFToken': csrf,
+    }
+
+
+def make_request(rng, name, question_ids, tag_ids):
+    """
+    (method, path, POST data, expected status) of one request to endpoint name.
+    """
+    if name == 'index':
+        return 'GET', '/', None, 200
+    if name == 'hot_questions':
+        return 'GET', '/hot', None, 200
+    if name == 'question':
+        return 'GET', f'/question/{rng.choice(question_ids)}', None, 200
+    if name == 'tag':
+        return 'GET', f'/tag/{rng.choice(tag_ids)}', None, 200
+    if name == 'vote':
+        return 'POST', '/vote/', {
+            'data_id': rng.choice(question_ids),
+            'vote_type': rng.choice(['like', 'dislike']),
+            'obj_type': 'question',
+        }, 200
+    if name == 'ask':
+        n = rng.randrange(10 ** 9)
+        return 'POST', '/ask', {'title': f'Benchmark question {n}', 'text': 'Benchmark text', 'tags': ''}, 302
+
+
+def sample(response, expected, elapsed):
+    """
+    (seconds, queries) of a response, (None, None) for an error.
+    """
+    status, headers, _ = response
+    if status != expected:
+        return None, None
+    match = QUERIES.search(headers.get('server-timing', ''))
+    return elapsed, int(match.group(1)) if match else None
+
+
+def summarize(samples, wall):
+    latencies = sorted(s[0] * 1000 for s in samples if s[0] is not None)
+    queries = [s[1] for s in samples if s[1] is not None]
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 3) if latencies else None,
+        'mean_ms': round(statistics.fmean(latencies), 3) if latencies else None,
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+        'queries': round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Latency/RPS/queries benchmark of the public endpoints, in-process or over HTTP, with a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ratio', type=int, default=None,
+                            help='seed the database with fill_db --bulk RATIO first (rows are kept)')
+        parser.add_argument('--server', choices=['wsgi', 'gunicorn', 'url'], default='wsgi',
+                            help='wsgi: call web_project.wsgi in-process; gunicorn: start one; url: use --url')
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--gunicorn-workers', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per endpoint')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--read-only', action='store_true', help='skip vote and ask')
+        parser.add_argument('--logged-in', action='store_true',
+                            help='read pages as the bench user too, past the anonymous page cache')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='print the change against a previous JSON result')
+
+    def handle(self, *args, **options):
+        if options['ratio']:
+            call_command('fill_db', str(options['ratio']), bulk=True, stdout=self.stdout)
+
+        question_ids = list(Question.objects.values_list('pk', flat=True)[:10000])
+        tag_ids = list(Tag.objects.values_list('pk', flat=True)[:10000])
+        if not question_ids or not tag_ids:
+            raise CommandError('No questions or tags to request, seed the database with --ratio')
+
+        endpoints = [name for name in options['endpoints'].split(',') if name]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        if options['read_only']:
+            endpoints = [name for name in endpoints if name not in WRITES]
+
+        self.rng = random.Random(options['seed'])
+        self.question_ids, self.tag_ids = question_ids, tag_ids
+        self.auth_headers = login_headers()
+
+        server = None
+        if options['server'] == 'wsgi':
+            client = WSGIClient()
+        elif options['server'] == 'gunicorn':
+            server, url = self.start_gunicorn(options['gunicorn_workers'])
+            client = HTTPClient(url)
+        else:
+            client = HTTPClient(options['url'])
+
+        results = {}
+        try:
+            self.stdout.write(
+                f'{"endpoint":<14} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} '
+                f'{"p99 ms":>8} {"rps":>8} {"queries":>8}'
+            )
+            for name in endpoints:
+                results[name] = self.run_endpoint(client, name, options)
+                self.print_row(name, results[name])
+        finally:
+            if isinstance(client, HTTPClient):
+                client.close()
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'vendor': connection.vendor,
+                'server': options['server'],
+                'concurrency': options['concurrency'],
+                'logged_in': options['logged_in'],
+                'requests': options['requests'],
+                'questions': Question.objects.count(),
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+
+    def start_gunicorn(self, workers):
+        binary = shutil.which('gunicorn')
+        if binary is None:
+            raise CommandError('gunicorn is not installed; use --server wsgi or --server url')
+        port = free_port()
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'web_project.settings')}
+        server = subprocess.Popen(
+            [binary, 'web_project.wsgi:application', '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+            env=env, cwd=settings.BASE_DIR,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                if server.poll() is not None:
+                    raise CommandError('gunicorn exited during startup')
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn did not start listening within 30 s')
+
+    def run_endpoint(self, client, name, options):
+        headers = self.auth_headers if name in WRITES or options['logged_in'] else {}
+        requests = [
+            make_request(self.rng, name, self.question_ids, self.tag_ids)
+            for _ in range(options['warmup'] + options['requests'])
+        ]
+
+        def send(request):
+            method, path, data, expected = request
+            started = time.perf_counter()
+            try:
+                response = client.request(method, path, data, headers)
+            except Exception:
+                return None, None
+            return sample(response, expected, time.perf_counter() - started)
+
+        warmup, measured = requests[:options['warmup']], requests[options['warmup']:]
+        for request in warmup:
+            send(request)
+
+        started = time.perf_counter()
+        if options['concurrency'] > 1:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                samples = list(executor.map(send, measured))
+        else:
+            samples = [send(request) for request in measured]
+        return summarize(samples, time.perf_counter() - started)
+
+    def print_row(self, name, row):
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        self.stdout.write(
+            f'{name:<14} {row["requests"]:>8} {row["errors"]:>6} {fmt(row["p50_ms"], ">8.2f")} '
+            f'{fmt(row["p95_ms"], ">8.2f")} {fmt(row["p99_ms"], ">8.2f")} {fmt(row["rps"], ">8.1f")} '
+            f'{fmt(row["queries"], ">8.2f")}'
+        )
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f'\nChange against {before["meta"].get("created_at")} ({before["meta"].get("server")}):')
+        self.stdout.write(f'{"endpoint":<14} {"p50 ms":>24} {"p95 ms":>24} {"rps":>24} {"queries":>16}')
+        for name, row in after['endpoints'].items():
+            old = before['endpoints'].get(name)
+            if old is None:
+                continue
+            cells = []
+            for key, width in (('p50_ms', 24), ('p95_ms', 24), ('rps', 24), ('queries', 16)):
+                if old.get(key) is None or row.get(key) is None:
+                    cells.append(f'{"-":>{width}}')
+                    continue
+                cell = f'{old[key]:g}->{row[key]:g}'
+                if old[key]:
+                    cell += f' ({(row[key] - old[key]) / old[key] * 100:+.0f}%)'
+                cells.append(f'{cell:>{width}}')
+            self.stdout.write(f'{name:<14} ' + ' '.join(cells))
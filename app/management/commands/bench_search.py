@@ -0,0 +1,49 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import search
+from app.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Run random searches over the current questions (e.g. after fill_db) and check the latency target'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--target-ms', type=float, default=50.0, help='p95 latency target')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sample = list(Question.objects.order_by('?').values_list('title', 'text')[:500])
+        if not sample:
+            raise CommandError('No questions, run fill_db first')
+
+        words = [w for title, text in sample for w in search.tokenize(f'{title} {text}') if len(w) > 2]
+        queries = [' '.join(rng.sample(words, k=rng.choice([1, 1, 2]))) for _ in range(options['queries'])]
+
+        backend = search.get_backend()
+        started = time.perf_counter()
+        if hasattr(backend, 'ensure_built'):
+            backend.ensure_built()
+        self.stdout.write(f'{type(backend).__name__}: ready in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter()
+            page = search.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+            found += bool(page.object_list)
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'queries={len(queries)} with_results={found} p50={p50:.2f}ms p95={p95:.2f}ms max={timings[-1]:.2f}ms')
+
+        if p95 > options['target_ms']:
+            raise CommandError(f'p95 {p95:.2f}ms is over the {options["target_ms"]}ms target')
+        self.stdout.write(self.style.SUCCESS('Latency target met'))
@@ -0,0 +1,112 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+
+from app.models import Like, Profile, Question, QuestionVote
+
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'EXPLAIN and time vote lookups on the legacy Like table against QuestionVote (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--votes', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--plans', action='store_true', help='print the full EXPLAIN output')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        owner = User.objects.create_user('bench_vote_tables_owner')
+        users = User.objects.bulk_create([User(username=f'bench_vote_tables_{i}') for i in range(options['users'])])
+        profiles = Profile.objects.bulk_create([Profile(user=user) for user in users])
+        questions = Question.objects.bulk_create(
+            [Question(title=f'bench {i}', text='bench', user=owner) for i in range(options['questions'])],
+            batch_size=1000,
+        )
+
+        pairs = set()
+        while len(pairs) < min(options['votes'], len(profiles) * len(questions)):
+            pairs.add((rng.choice(profiles).pk, rng.choice(questions).pk))
+        content_type = ContentType.objects.get_for_model(Question)
+        votes = [(profile_id, question_id, rng.choice((1, 1, 1, -1))) for profile_id, question_id in sorted(pairs)]
+
+        Like.objects.bulk_create(
+            [Like(user_id=p, content_type=content_type, object_id=q, vote=v) for p, q, v in votes],
+            batch_size=2000,
+        )
+        QuestionVote.objects.bulk_create(
+            [QuestionVote(user_id=p, question_id=q, vote=v) for p, q, v in votes],
+            batch_size=2000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return rng, profiles, questions, content_type
+
+    def run(self, options):
+        rng, profiles, questions, content_type = self.seed(options)
+        profile = rng.choice(profiles)
+        page = [q.pk for q in rng.sample(questions, 20)]
+        target = rng.choice(questions).pk
+
+        legacy = Like.objects.filter(content_type=content_type)
+        cases = [
+            ('user votes on a page',
+             legacy.filter(user=profile, object_id__in=page).values_list('object_id', 'vote'),
+             QuestionVote.objects.filter(user=profile, question__in=page).values_list('question', 'vote')),
+            ('previous vote',
+             legacy.filter(user=profile, object_id=target).values_list('vote'),
+             QuestionVote.objects.filter(user=profile, question=target).values_list('vote')),
+            ('rating of one question',
+             legacy.filter(object_id=target).values('object_id').annotate(total=Sum('vote')).values('total'),
+             QuestionVote.objects.filter(question=target).values('question').annotate(total=Sum('vote')).values('total')),
+            ('rating recompute, 100 questions',
+             self.recompute(Like.objects.filter(content_type=content_type, object_id=OuterRef('pk')), 'object_id'),
+             self.recompute(QuestionVote.objects.filter(question=OuterRef('pk')), 'question')),
+        ]
+
+        self.stdout.write(f'{"query":<34} {"table":<8} {"median ms":>10}  plan')
+        for name, before, after in cases:
+            for table, queryset in (('Like', before), ('typed', after)):
+                median = self.measure(queryset, options['repeat'])
+                plan = queryset.explain()
+                summary = plan if options['plans'] else self.summarize(plan)
+                self.stdout.write(f'{name:<34} {table:<8} {median:>10.3f}  {summary}')
+
+    def recompute(self, votes, column):
+        total = votes.order_by().values(column).annotate(total=Sum('vote')).values('total')
+        return Question.objects.filter(title__startswith='bench ').order_by('pk')[:100].annotate(
+            total=Subquery(total, output_field=IntegerField())
+        ).values_list('pk', 'total')
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def summarize(self, plan):
+        # the scan/index lines are what changes between the two tables
+        lines = [line.strip(' ->') for line in plan.splitlines()]
+        scans = [line for line in lines if 'SCAN' in line or 'SEARCH' in line or 'Scan' in line]
+        return ' | '.join(scans or lines[:1])
@@ -0,0 +1,97 @@
+import random
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app import fragment_cache, ranking
+from app.models import Profile, Question, QuestionVote, Vote
+from app.vote_buffer import VoteBuffer
+
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Compare synchronous and buffered voting on a burst of votes for a few questions (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--questions', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        self.options = options
+        owner = User.objects.create_user('bench_votes_owner')
+        users = User.objects.bulk_create([User(username=f'bench_votes_{i}') for i in range(options['users'])])
+        profiles = Profile.objects.bulk_create([Profile(user=user) for user in users])
+        questions = [
+            Question.objects.create(title=f'bench {i}', text='bench', user=owner)
+            for i in range(options['questions'])
+        ]
+
+        rng = random.Random(options['seed'])
+        burst = [
+            (rng.choice(profiles), rng.choice(questions).pk, rng.choice((Vote.LIKE, Vote.DISLIKE)))
+            for _ in range(options['votes'])
+        ]
+
+        self.stdout.write(f'{"mode":>9} {"votes":>7} {"queries":>8} {"total ms":>10} {"votes/s":>10}')
+
+        def synchronous():
+            # what the vote view does per request
+            for profile, question_id, vote in burst:
+                QuestionVote.objects.set_vote(profile, question_id, vote)
+                fragment_cache.bump(Question(pk=question_id))
+                ranking.update(question_id)
+
+        sync_ratings = self.measure('sync', synchronous, questions)
+        self.reset(questions)
+
+        with tempfile.TemporaryDirectory() as journal_dir:
+            buffer = VoteBuffer(journal_dir=journal_dir, interval=3600).start()
+
+            def buffered():
+                for profile, question_id, vote in burst:
+                    buffer.submit_vote(profile, Question, question_id, vote)
+                buffer.flush()
+
+            buffered_ratings = self.measure('buffered', buffered, questions)
+            buffer.stop()
+
+        if sync_ratings != buffered_ratings:
+            self.stderr.write(f'Ratings differ: {sync_ratings} != {buffered_ratings}')
+
+    def measure(self, mode, func, questions):
+        votes = self.options['votes']
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{mode:>9} {votes:>7} {queries:>8} {elapsed * 1000:>10.1f} {votes / elapsed:>10.0f}'
+        )
+        return dict(Question.objects.filter(pk__in=[q.pk for q in questions]).values_list('pk', 'rating'))
+
+    def reset(self, questions):
+        ids = [q.pk for q in questions]
+        QuestionVote.objects.filter(question__in=ids).delete()
+        Question.objects.filter(pk__in=ids).update(rating=0)
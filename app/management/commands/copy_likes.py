@@ -0,0 +1,64 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from app.models import Answer, Like, Question, Vote
+
+
+# Copies one id window of Like rows for one target type. Rows whose target is
+# gone are dropped by the join (Like has no foreign key to enforce that), and
+# votes already cast into the new table win over the legacy ones.
+COPY_SQL = """
+    INSERT INTO {votes} ({target_column}, user_id, vote, created_at)
+    SELECT l.object_id, l.user_id, l.vote, l.created_at
+    FROM {like} l
+    JOIN {target} t ON t.id = l.object_id
+    WHERE l.content_type_id = %s AND l.id >= %s AND l.id < %s
+    ON CONFLICT ({target_column}, user_id) DO NOTHING
+"""
+
+class Command(BaseCommand):
+    help = 'Copy legacy Like rows into QuestionVote/AnswerVote in id-range batches, then rebuild ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--skip-stats', action='store_true',
+                            help='do not run rebuild_stats afterwards')
+
+    def handle(self, *args, **options):
+        bounds = Like.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            self.stdout.write('Nothing to copy')
+            return
+
+        quote = connection.ops.quote_name
+        statements = []
+        for model in (Question, Answer):
+            votes = Vote.for_model(model)
+            sql = COPY_SQL.format(
+                votes=quote(votes._meta.db_table),
+                target_column=quote(votes.objects.target_field.column),
+                like=quote(Like._meta.db_table),
+                target=quote(model._meta.db_table),
+            )
+            statements.append((votes, sql, ContentType.objects.get_for_model(model).pk))
+
+        batch_size = options['batch_size']
+        copied = {votes: 0 for votes, _, _ in statements}
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                for votes, sql, content_type_id in statements:
+                    cursor.execute(sql, [content_type_id, start, start + batch_size])
+                    copied[votes] += max(cursor.rowcount, 0)
+            self.stdout.write(f'Copied ids {start}..{min(start + batch_size, bounds["high"] + 1) - 1}')
+
+        self.stdout.write(self.style.SUCCESS(
+            'Copied votes: ' + ', '.join(f'{votes.__name__}={count}' for votes, count in copied.items())
+        ))
+
+        # votes cast between the migration and this copy were applied on top
+        # of ratings that already counted the legacy rows
+        if not options['skip_stats']:
+            call_command('rebuild_stats', stdout=self.stdout)
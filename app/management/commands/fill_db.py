@@ -1,21 +1,228 @@
+import csv
+import io
+import math
+import multiprocessing
+import os
 import random
 import string
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
+import django
+from django.apps import apps
 from django.contrib.auth.hashers import make_password
-from app.models import Profile, Tag, Question, Answer, Like
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from app import bulk_load
+from app.models import Answer, AnswerVote, Profile, Question, QuestionVote, Tag, TagPosting
+
+
+INSERT_BATCH = 2000
+
+# Seeded content is spread over this period, newest ids last.
+HISTORY = timedelta(days=365)
 
-def rnd_text(words=10):
-    return ' '.join(''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 8)))
+# Tables that get the bulk of the rows; in --bulk mode their secondary
+# indexes are dropped for the load and built once at the end.
+BULK_MODELS = [Question, Question.tags.through, TagPosting, Answer, QuestionVote, AnswerVote]
+
+
+def rnd_text(rng, words=10):
+    return ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8)))
                     for _ in range(words))
 
+
+def write_rows(table, columns, rows, use_copy):
+    """
+    Appends rows (tuples in columns order) to table: COPY FROM STDIN on
+    PostgreSQL, batched executemany elsewhere. bulk_create is not used
+    because it would overwrite the generated auto_now_add timestamps.
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    column_list = ', '.join(quote(column) for column in columns)
+
+    with connection.cursor() as cursor:
+        if use_copy:
+            buffer = io.StringIO()
+            # strings quoted, None left empty: that is how COPY csv tells '' from NULL
+            csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+            sql = f'COPY {quote(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            return
+
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = [tuple(adapt(v) if isinstance(v, datetime) else v for v in row) for row in rows]
+        sql = f'INSERT INTO {quote(table)} ({column_list}) VALUES ({", ".join(["%s"] * len(columns))})'
+        for start in range(0, len(rows), INSERT_BATCH):
+            cursor.executemany(sql, rows[start:start + INSERT_BATCH])
+
+
+class Plan:
+    """
+    Everything a worker needs to generate any chunk on its own: sizes, the
+    first id of every table, the seed and the vote permutation. A chunk's
+    rows depend only on the plan and the chunk bounds, so the result is the
+    same whatever the number of workers.
+    """
+
+    def __init__(self, ratio, seed, chunk_size, use_copy):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy
+        self.now = timezone.now()
+        self.password = make_password('password')
+
+        self.users = ratio
+        self.tags = ratio
+        self.questions = ratio * 10
+        self.answers = ratio * 100
+
+        self.first_user = (User.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        self.first_profile = (Profile.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        self.first_tag = (Tag.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        self.first_question = (Question.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+        self.first_answer = (Answer.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+
+        # Votes are distinct (profile, target) pairs: pair k of the vote list
+        # is (multiplier * k + offset) mod pairs, a permutation of the pair
+        # space when gcd(multiplier, pairs) == 1. No sampling, no rejection,
+        # and any range of k can be generated independently.
+        self.pairs = self.users * (self.questions + self.answers)
+        self.votes = min(ratio * 200, self.pairs)
+        rng = random.Random(f'{seed}:votes')
+        multiplier = rng.randrange(self.pairs // 3, self.pairs // 2 + 2) | 1
+        while math.gcd(multiplier, self.pairs) != 1:
+            multiplier += 2
+        self.multiplier = multiplier
+        self.offset = rng.randrange(self.pairs)
+
+    def rng(self, phase, start):
+        return random.Random(f'{self.seed}:{phase}:{start}')
+
+    def question_created(self, index):
+        return self.now - HISTORY * (self.questions - index) / self.questions
+
+    def phases(self):
+        return [
+            ('users', self.users, gen_users),
+            ('profiles', self.users, gen_profiles),
+            ('tags', self.tags, gen_tags),
+            ('questions', self.questions, gen_questions),
+            ('answers', self.answers, gen_answers),
+            ('votes', self.votes, gen_votes),
+        ]
+
+
+def gen_users(plan, rng, start, end):
+    rows = []
+    for i in range(start, end):
+        pk = plan.first_user + i
+        rows.append((pk, plan.password, False, f'testuser_{pk}', '', '', f'testuser_{pk}@example.com', False, True, plan.now))
+    write_rows(User._meta.db_table, [
+        'id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+    ], rows, plan.use_copy)
+    return len(rows)
+
+
+def gen_profiles(plan, rng, start, end):
+    rows = [(plan.first_profile + i, plan.first_user + i, None, False, False) for i in range(start, end)]
+    write_rows(Profile._meta.db_table, ['id', 'user_id', 'avatar', 'has_avatar', 'avatar_thumbnails'], rows, plan.use_copy)
+    return len(rows)
+
+
+def gen_tags(plan, rng, start, end):
+    rows = [(plan.first_tag + i, f'tag_{plan.first_tag + i}_{rnd_text(rng, 1)}', 0) for i in range(start, end)]
+    write_rows(Tag._meta.db_table, ['id', 'name', 'questions_count'], rows, plan.use_copy)
+    return len(rows)
+
+
+def gen_questions(plan, rng, start, end):
+    questions, links, postings = [], [], []
+    for i in range(start, end):
+        pk = plan.first_question + i
+        created = plan.question_created(i)
+        questions.append((pk, f'Question {pk} {rnd_text(rng, 3)}', rnd_text(rng, 40),
+                          plan.first_user + rng.randrange(plan.users), created, created, 0, 0))
+        for tag in rng.sample(range(plan.tags), k=rng.randint(1, min(3, plan.tags))):
+            links.append((pk, plan.first_tag + tag))
+            postings.append((plan.first_tag + tag, pk, created))
+
+    write_rows(Question._meta.db_table, [
+        'id', 'title', 'text', 'user_id', 'created_at', 'updated_at', 'rating', 'answers_count',
+    ], questions, plan.use_copy)
+    write_rows(Question.tags.through._meta.db_table, ['question_id', 'tag_id'], links, plan.use_copy)
+    write_rows(TagPosting._meta.db_table, ['tag_id', 'question_id', 'created_at'], postings, plan.use_copy)
+    return len(questions)
+
+
+def gen_answers(plan, rng, start, end):
+    rows = []
+    for i in range(start, end):
+        question = rng.randrange(plan.questions)
+        asked = plan.question_created(question)
+        created = asked + (plan.now - asked) * rng.random()
+        rows.append((plan.first_answer + i, plan.first_question + question, rnd_text(rng, 20), rng.random() < 0.05,
+                     plan.first_profile + rng.randrange(plan.users), created, created, 0))
+    write_rows(Answer._meta.db_table, [
+        'id', 'question_id', 'text', 'is_correct', 'user_id', 'created_at', 'updated_at', 'rating',
+    ], rows, plan.use_copy)
+    return len(rows)
+
+
+def gen_votes(plan, rng, start, end):
+    question_votes, answer_votes = [], []
+    for k in range(start, end):
+        pair = (plan.multiplier * k + plan.offset) % plan.pairs
+        target, profile = divmod(pair, plan.users)
+        row_vote = rng.choice((1, 1, 1, -1))
+        if target < plan.questions:
+            question_votes.append((plan.first_question + target, plan.first_profile + profile, row_vote, plan.now))
+        else:
+            answer_votes.append((plan.first_answer + target - plan.questions, plan.first_profile + profile, row_vote, plan.now))
+    write_rows(QuestionVote._meta.db_table, ['question_id', 'user_id', 'vote', 'created_at'], question_votes, plan.use_copy)
+    write_rows(AnswerVote._meta.db_table, ['answer_id', 'user_id', 'vote', 'created_at'], answer_votes, plan.use_copy)
+    return len(question_votes) + len(answer_votes)
+
+
+def run_chunk(task):
+    plan, phase, generate, start, end = task
+    with transaction.atomic():
+        return generate(plan, plan.rng(phase, start), start, end)
+
+
+def init_worker():
+    # spawn-based platforms start with a fresh interpreter
+    if not apps.ready:
+        django.setup()
+
+
 class Command(BaseCommand):
-    help = 'Fill DB with test data: python manage.py fill_db [ratio]'
+    help = 'Fill DB with test data: python manage.py fill_db [ratio] [--seed N] [--workers N] [--bulk]'
 
     def add_arguments(self, parser):
         parser.add_argument('ratio', type=int, nargs='?', default=1)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='worker processes (default: CPU count on PostgreSQL, 1 elsewhere)')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--no-copy', action='store_true', help='use INSERT batches even on PostgreSQL')
+        parser.add_argument('--bulk', action='store_true',
+                            help='drop secondary indexes for the load and rebuild them afterwards')
 
     def handle(self, *args, **options):
         ratio = options['ratio']
@@ -23,130 +230,98 @@ class Command(BaseCommand):
             self.stderr.write('ratio должен быть > 0')
             return
 
-        num_users = ratio
-        num_tags = ratio
-        num_questions = ratio * 10
-        num_answers = ratio * 100
-        num_likes = ratio * 200
-
-        self.stdout.write('Начинаем генерацию данных...')
-
-        default_password = make_password('password') 
-        last_id = User.objects.last().id if User.objects.exists() else 0
-        
-        users_list = [
-            User(
-                username=f'testuser_{last_id + i + 1}',
-                email=f'testuser_{last_id + i + 1}@example.com',
-                password=default_password,
-                is_active=True
-            ) for i in range(num_users)
-        ]
+        postgres = connection.vendor == 'postgresql'
+        workers = options['workers'] or (os.cpu_count() if postgres else 1)
+        if not postgres and workers > 1:
+            self.stderr.write('SQLite не поддерживает параллельную запись, используем 1 процесс')
+            workers = 1
 
-        User.objects.bulk_create(users_list, ignore_conflicts=True)
-        
-        users = list(User.objects.filter(username__startswith='testuser_').order_by('-id')[:num_users])
-        self.stdout.write(f'Создано пользователей: {len(users)}')
+        plan = Plan(ratio, options['seed'], options['chunk_size'], postgres and not options['no_copy'])
+        self.stdout.write(
+            f'Начинаем генерацию данных: процессов {workers}, '
+            f'{"COPY" if plan.use_copy else "INSERT"}, seed {plan.seed}'
+        )
 
-        existing_profile_user_ids = set(Profile.objects.values_list('user_id', flat=True))
-        profiles_list = [
-            Profile(user=u) 
-            for u in users 
-            if u.id not in existing_profile_user_ids
-        ]
-        Profile.objects.bulk_create(profiles_list, ignore_conflicts=True)
-        
-        profiles = list(Profile.objects.filter(user__in=users))
-        self.stdout.write(f'Создано профилей: {len(profiles_list)}')
-
-        last_tag_id = Tag.objects.last().id if Tag.objects.exists() else 0
-        tags_list = [
-            Tag(name=f'tag_{last_tag_id + i + 1}_{rnd_text(1)}') 
-            for i in range(num_tags)
-        ]
-        Tag.objects.bulk_create(tags_list, ignore_conflicts=True)
-        
-        tags = list(Tag.objects.all().order_by('-id')[:num_tags])
-        self.stdout.write(f'Создано тегов: {len(tags)}')
-
-        questions_list = [
-            Question(
-                title=f'Question {i+1} {rnd_text(3)}',
-                text=rnd_text(40),
-                user=random.choice(users)
-            ) for i in range(num_questions)
-        ]
-        Question.objects.bulk_create(questions_list)
-        
-        questions = list(Question.objects.all().order_by('-created_at')[:num_questions])
-        self.stdout.write(f'Создано вопросов: {len(questions)}')
-
-        QuestionTag = Question.tags.through
-        q_tags_relations = []
-        for q in questions:
-            if not tags: break
-            cnt = random.randint(1, min(3, len(tags)))
-            chosen_tags = random.sample(tags, k=cnt)
-            for t in chosen_tags:
-                q_tags_relations.append(QuestionTag(question_id=q.id, tag_id=t.id))
-        
-        QuestionTag.objects.bulk_create(q_tags_relations, ignore_conflicts=True)
-        self.stdout.write('Теги привязаны к вопросам')
-
-        answers_list = [
-            Answer(
-                question=random.choice(questions),
-                text=rnd_text(20),
-                user=random.choice(profiles),
-                is_correct=(random.random() < 0.05)
-            ) for _ in range(num_answers)
-        ]
-        Answer.objects.bulk_create(answers_list)
-        
-        answers = list(Answer.objects.all().order_by('-created_at')[:num_answers])
-        self.stdout.write(f'Создано ответов: {len(answers)}')
-        
-        # 7. LIKES (с учетом поля vote)
-        all_targets = questions + answers
-        ct_question = ContentType.objects.get_for_model(Question)
-        ct_answer = ContentType.objects.get_for_model(Answer)
-        
-        likes_to_create = []
-        unique_likes = set()
-        
-        attempts = 0
-        max_attempts = num_likes * 5
-        
-        while len(likes_to_create) < num_likes and attempts < max_attempts:
-            attempts += 1
-            target = random.choice(all_targets)
-            prof = random.choice(profiles)
-            
-            if isinstance(target, Question):
-                ct_id = ct_question.id
-            else:
-                ct_id = ct_answer.id
-                
-            pair = (prof.id, ct_id, target.id)
-            
-            if pair in unique_likes:
-                continue
-            
-            unique_likes.add(pair)
-            
-            vote_val = random.choice([1, 1, 1, -1]) 
-            
-            likes_to_create.append(
-                Like(
-                    user=prof, 
-                    content_type_id=ct_id, 
-                    object_id=target.id,
-                    vote=vote_val
-                )
-            )
-
-        Like.objects.bulk_create(likes_to_create, ignore_conflicts=True)
-        
+        pool = None
+        if workers > 1:
+            # children must not share the parent's database connection
+            connections.close_all()
+            pool = multiprocessing.Pool(workers, initializer=init_worker)
+
+        self.timings = []
+        started = time.perf_counter()
+        indexes = []
+        try:
+            if options['bulk']:
+                with self.timed('удаление индексов'):
+                    indexes = bulk_load.drop_indexes(BULK_MODELS)
+                self.stdout.write(f'Удалено индексов: {len(indexes)}')
+            try:
+                for phase, total, generate in plan.phases():
+                    with self.timed(phase):
+                        self.run_phase(pool, plan, phase, total, generate)
+
+                if postgres:
+                    # ids were set explicitly, move the sequences past them
+                    with connection.cursor() as cursor:
+                        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Profile, Tag, Question, Answer]):
+                            cursor.execute(sql)
+
+                # Rows were written without signals, so recompute counters
+                # once. In bulk mode this runs before the indexes are back:
+                # the aggregates only need the unique indexes, and the
+                # rewritten rows then have no secondary indexes to update.
+                with self.timed('счётчики'):
+                    call_command('rebuild_stats', stdout=self.stdout)
+            finally:
+                # even after a failed load the schema must come back whole
+                if indexes:
+                    with self.timed('создание индексов'):
+                        if pool:
+                            pool.map(bulk_load.create_index, indexes, chunksize=1)
+                        else:
+                            for sql in indexes:
+                                bulk_load.create_index(sql)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        with self.timed('hot'):
+            call_command('rebuild_hot', stdout=self.stdout)
+        with self.timed('ANALYZE'):
+            bulk_load.analyze([User, Profile, Tag, *BULK_MODELS])
+
+        self.stdout.write('Время по фазам:')
+        for name, elapsed in self.timings:
+            self.stdout.write(f'  {name:<20} {elapsed:>8.2f} с')
         self.stdout.write(self.style.SUCCESS(
-            f'Успешно! Создано лайков: {len(likes_to_create)} (цель: {num_likes})'
-        ))
\ No newline at end of file
+            f'Успешно за {time.perf_counter() - started:.1f} с! Создано лайков: {plan.votes}'
+        ))
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - started))
+
+    def run_phase(self, pool, plan, phase, total, generate):
+        tasks = [
+            (plan, phase, generate, start, min(start + plan.chunk_size, total))
+            for start in range(0, total, plan.chunk_size)
+        ]
+        results = pool.imap_unordered(run_chunk, tasks) if pool else map(run_chunk, tasks)
+
+        started = last_report = time.perf_counter()
+        done = 0
+        for rows in results:
+            done += rows
+            now = time.perf_counter()
+            if now - last_report >= 1 and done < total:
+                self.stdout.write(f'  {phase}: {done}/{total} ({done / (now - started):.0f} строк/с)')
+                last_report = now
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Создано {phase}: {done} за {elapsed:.2f} с ({done / elapsed if elapsed else 0:.0f} строк/с)')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app import ranking
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hot ranking of every question'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = ranking.rebuild(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Hot scores rebuilt: {total}'))
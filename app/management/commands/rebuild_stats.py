@@ -0,0 +1,165 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Exists, IntegerField, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from app.models import Answer, AnswerVote, Question, QuestionVote, Tag, TagPosting
+
+
+# Recomputes one id window of a counter table from aggregates of its source
+# tables in one statement; rows already holding the right values are left
+# alone. Each source is pre-aggregated over the same window, so a chunk reads
+# only its own slice of the votes/answers/postings.
+UPDATE_FROM_SQL = """
+    UPDATE {table} SET {assignments}
+    FROM (
+        SELECT t.id, {columns}
+        FROM {table} t
+        {joins}
+        WHERE t.id >= %s AND t.id < %s
+    ) s
+    WHERE {table}.id = s.id AND ({changed})
+"""
+
+JOIN_SQL = """
+        LEFT JOIN (
+            SELECT {fk} AS target_id, {aggregate} AS total FROM {source}
+            WHERE {fk} >= %s AND {fk} < %s
+            GROUP BY {fk}
+        ) {alias} ON {alias}.target_id = t.id
+"""
+
+
+def counters():
+    """
+    (model, [(field, source model, source foreign key, SQL aggregate, ORM aggregate)])
+    for every denormalized counter.
+    """
+    return [
+        (Question, [
+            ('rating', QuestionVote, 'question', 'SUM(vote)', Sum('vote')),
+            ('answers_count', Answer, 'question', 'COUNT(*)', Count('pk')),
+        ]),
+        (Answer, [
+            ('rating', AnswerVote, 'answer', 'SUM(vote)', Sum('vote')),
+        ]),
+        (Tag, [
+            ('questions_count', TagPosting, 'tag', 'COUNT(*)', Count('pk')),
+        ]),
+    ]
+
+def supports_update_from():
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 33)
+
+def update_from_sql(model, fields):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    assignments, columns, joins, changed = [], [], [], []
+    for i, (field, source, fk, aggregate, _) in enumerate(fields):
+        column = quote(model._meta.get_field(field).column)
+        alias = f'a{i}'
+        assignments.append(f'{column} = s.{column}')
+        columns.append(f'COALESCE({alias}.total, 0) AS {column}')
+        joins.append(JOIN_SQL.format(
+            fk=quote(source._meta.get_field(fk).column),
+            aggregate=aggregate,
+            source=quote(source._meta.db_table),
+            alias=alias,
+        ))
+        changed.append(f'{table}.{column} <> s.{column}')
+    return UPDATE_FROM_SQL.format(
+        table=table,
+        assignments=', '.join(assignments),
+        columns=', '.join(columns),
+        joins=''.join(joins),
+        changed=' OR '.join(changed),
+    )
+
+def update_chunk(sql, fields, start, end):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start, end] * (len(fields) + 1))
+        return max(cursor.rowcount, 0)
+
+def update_chunk_orm(model, fields, start, end):
+    # correlated subqueries for backends without UPDATE ... FROM
+    values = {}
+    for field, source, fk, _, aggregate in fields:
+        total = Subquery(
+            source.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=aggregate)
+            .values('total'),
+            output_field=IntegerField(),
+        )
+        values[field] = Coalesce(total, 0)
+    return model.objects.filter(pk__gte=start, pk__lt=end).update(**values)
+
+def sync_postings():
+    """
+    Brings TagPosting in line with the question-tag relation after bulk
+    inserts that bypass Question.add_tags; returns (added, removed).
+    """
+    Through = Question.tags.through
+    stale = TagPosting.objects.filter(
+        ~Exists(Through.objects.filter(question=OuterRef('question'), tag=OuterRef('tag')))
+    )
+    # the caller recomputes questions_count, so skip the per-row signal
+    removed = stale._raw_delete(stale.db)
+
+    missing = Through.objects.filter(
+        ~Exists(TagPosting.objects.filter(question=OuterRef('question'), tag=OuterRef('tag')))
+    ).order_by().values_list('question_id', 'tag_id', 'question__created_at')
+    added = len(TagPosting.objects.bulk_create(
+        [TagPosting(question_id=q, tag_id=t, created_at=created) for q, t, created in missing.iterator(chunk_size=2000)],
+        batch_size=2000,
+    ))
+    return added, removed
+
+class Command(BaseCommand):
+    help = 'Recompute Question/Answer rating, answers_count and tag postings/counts from the underlying rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='ids of the counter table recomputed per statement')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        update_from = supports_update_from()
+        updated = {}
+
+        for model, fields in counters():
+            if model is Tag:
+                # tag counts are read from the postings, sync them first
+                started = time.perf_counter()
+                with transaction.atomic():
+                    added, removed = sync_postings()
+                self.report('postings', added + removed, started)
+
+            started = time.perf_counter()
+            sql = update_from_sql(model, fields) if update_from else None
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            total = 0
+            if bounds['low'] is not None:
+                for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+                    end = start + chunk_size
+                    with transaction.atomic():
+                        if sql is None:
+                            total += update_chunk_orm(model, fields, start, end)
+                        else:
+                            total += update_chunk(sql, fields, start, end)
+            name = model._meta.verbose_name_plural
+            updated[name] = total
+            self.report(name, total, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Updated counters: ' + ', '.join(f'{name}={total}' for name, total in updated.items())
+            + f' (postings added={added}, removed={removed})'
+        ))
+
+    def report(self, name, rows, started):
+        self.stdout.write(f'  {name}: {rows} rows in {time.perf_counter() - started:.2f} s')
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import sidebar
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "Popular Tags" and "Best Members" sidebar and store it in the cache'
+
+    def handle(self, *args, **options):
+        if not sidebar.is_shared():
+            alias = getattr(settings, 'SIDEBAR_CACHE_ALIAS', 'default')
+            raise CommandError(
+                f'Cache "{alias}" is local to this process, the web workers would never see the result. '
+                f'Point SIDEBAR_CACHE_ALIAS at a shared cache or rely on the per-worker scheduler.'
+            )
+        data = sidebar.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sidebar refreshed: {len(data['popular_tags'])} tags, {len(data['best_members'])} members"
+        ))
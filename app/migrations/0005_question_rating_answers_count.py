@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('app', 'Like')
+    Question = apps.get_model('app', 'Question')
+    Answer = apps.get_model('app', 'Answer')
+
+    def likes_total(model_name):
+        content_type = ContentType.objects.filter(app_label='app', model=model_name).first()
+        if content_type is None:
+            return 0
+        return Coalesce(Subquery(
+            Like.objects.filter(content_type=content_type, object_id=OuterRef('pk'))
+            .order_by().values('object_id').annotate(total=Sum('vote')).values('total'),
+            output_field=IntegerField(),
+        ), 0)
+
+    Question.objects.update(
+        rating=likes_total('question'),
+        answers_count=Coalesce(Subquery(
+            Answer.objects.filter(question=OuterRef('pk'))
+            .order_by().values('question').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ), 0),
+    )
+    Answer.objects.update(rating=likes_total('answer'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_like_vote_alter_profile_avatar'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-rating', '-created_at'], name='answer_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-rating', '-created_at'], name='question_popular_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_question_rating_answers_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_popular_idx',
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-rating', '-created_at', '-id'], name='question_popular_idx'),
+        ),
+    ]
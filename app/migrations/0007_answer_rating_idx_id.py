@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_question_popular_idx_id'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='answer',
+            name='answer_rating_idx',
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-rating', '-created_at', '-id'], name='answer_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:57
+
+import math
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def hot_score(rating, answers_count, created_at):
+    # app.ranking.hot_score as of this migration, frozen here so later
+    # changes to the ranking cannot change or break it
+    answer_weight = getattr(settings, 'HOT_ANSWER_WEIGHT', 2)
+    decay = getattr(settings, 'HOT_DECAY_SECONDS', 45000)
+
+    activity = rating + answer_weight * answers_count
+    sign = (activity > 0) - (activity < 0)
+    order = math.log10(max(abs(activity), 1))
+    return round(sign * order + (created_at - EPOCH).total_seconds() / decay, 7)
+
+
+def backfill_scores(apps, schema_editor):
+    Question = apps.get_model('app', 'Question')
+    HotScore = apps.get_model('app', 'HotScore')
+    rows = Question.objects.values_list('id', 'rating', 'answers_count', 'created_at')
+    HotScore.objects.bulk_create(
+        [HotScore(question_id=pk, score=hot_score(rating, answers, created)) for pk, rating, answers, created in rows.iterator()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_answer_rating_idx_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotScore',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hot', serialize=False, to='app.question')),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-question'], name='hotscore_rank_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
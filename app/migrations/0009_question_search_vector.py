@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:05
+
+from django.db import migrations
+
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(text, '')), 'B')
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    # Only PostgreSQL gets the stored column; other databases use the
+    # in-process index from app/search.py.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'ALTER TABLE app_question ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED'
+    )
+    schema_editor.execute('CREATE INDEX question_search_idx ON app_question USING GIN (search_vector)')
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS question_search_idx')
+    schema_editor.execute('ALTER TABLE app_question DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_hotscore'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_question_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vote', models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike')], verbose_name='Vote')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('answer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='app.answer')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.profile')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['answer', 'vote'], name='answer_vote_idx')],
+                'constraints': [models.UniqueConstraint(fields=('answer', 'user'), name='unique_answer_vote')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vote', models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike')], verbose_name='Vote')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='app.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.profile')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['question', 'vote'], name='question_vote_idx')],
+                'constraints': [models.UniqueConstraint(fields=('question', 'user'), name='unique_question_vote')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_question_answer_votes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_new_idx'),
+        ),
+    ]
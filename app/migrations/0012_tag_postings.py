@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_postings(apps, schema_editor):
+    Question = apps.get_model('app', 'Question')
+    Tag = apps.get_model('app', 'Tag')
+    TagPosting = apps.get_model('app', 'TagPosting')
+    rows = Question.tags.through.objects.order_by().values_list('question_id', 'tag_id', 'question__created_at')
+    TagPosting.objects.bulk_create(
+        [TagPosting(question_id=q, tag_id=t, created_at=created) for q, t, created in rows.iterator(chunk_size=2000)],
+        batch_size=2000,
+    )
+    counts = TagPosting.objects.filter(tag=OuterRef('pk')).order_by().values('tag').annotate(total=Count('pk')).values('total')
+    Tag.objects.update(questions_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_question_new_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='questions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TagPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('question', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='app.question')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='app.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', '-created_at', '-question'], name='tag_posting_idx'), models.Index(fields=['question'], name='tag_posting_question_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tag', 'question'), name='unique_tag_posting')],
+            },
+        ),
+        migrations.RunPython(backfill_postings, migrations.RunPython.noop),
+    ]
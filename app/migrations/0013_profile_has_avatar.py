@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+def backfill_has_avatar(apps, schema_editor):
+    # the one storage check per avatar that rendering used to do every time
+    Profile = apps.get_model('app', 'Profile')
+    present = []
+    for profile in Profile.objects.exclude(avatar='').exclude(avatar__isnull=True).iterator():
+        try:
+            if profile.avatar.storage.exists(profile.avatar.name):
+                present.append(profile.pk)
+        except Exception:
+            pass
+    Profile.objects.filter(pk__in=present).update(has_avatar=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_tag_postings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='has_avatar',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_has_avatar, migrations.RunPython.noop),
+    ]
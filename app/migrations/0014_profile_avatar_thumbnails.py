@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_profile_has_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_thumbnails',
+            field=models.BooleanField(default=False),
+        ),
+    ]
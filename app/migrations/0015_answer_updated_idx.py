@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_profile_avatar_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-updated_at'], name='answer_updated_idx'),
+        ),
+    ]
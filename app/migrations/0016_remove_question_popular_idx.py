@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_answer_updated_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_popular_idx',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:02
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def merge_case_variants(apps, schema_editor):
+    """
+    QuestionForm.clean_tags lowercases names, tags created before it may
+    differ only in case. Each group keeps its lowercase tag, or the
+    oldest one renamed, and takes over the questions of the others.
+    """
+    Question = apps.get_model('app', 'Question')
+    Tag = apps.get_model('app', 'Tag')
+    TagPosting = apps.get_model('app', 'TagPosting')
+    Through = Question.tags.through
+
+    groups = defaultdict(list)
+    for pk, name in Tag.objects.order_by('pk').values_list('pk', 'name').iterator(chunk_size=2000):
+        groups[name.lower()].append((pk, name))
+
+    for lower, tags in groups.items():
+        if len(tags) == 1 and tags[0][1] == lower:
+            continue
+        keep = next((pk for pk, name in tags if name == lower), tags[0][0])
+        others = [pk for pk, _ in tags if pk != keep]
+
+        moved = (
+            set(Through.objects.filter(tag_id__in=others).values_list('question_id', flat=True))
+            - set(Through.objects.filter(tag_id=keep).values_list('question_id', flat=True))
+        )
+        rows = list(Question.objects.filter(pk__in=moved).values_list('pk', 'created_at'))
+        Through.objects.bulk_create([Through(question_id=q, tag_id=keep) for q, _ in rows], batch_size=2000)
+        TagPosting.objects.bulk_create(
+            [TagPosting(question_id=q, tag_id=keep, created_at=created) for q, created in rows], batch_size=2000,
+        )
+        # their question links and postings go with them
+        Tag.objects.filter(pk__in=others).delete()
+        Tag.objects.filter(pk=keep).update(name=lower, questions_count=TagPosting.objects.filter(tag_id=keep).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_remove_question_popular_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_case_variants, migrations.RunPython.noop),
+    ]
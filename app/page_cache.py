@@ -0,0 +1,242 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.http import http_date, parse_http_date_safe
+
+from app.models import Answer, Question
+
+
+LISTS = 'lists'
+
+
+def enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+
+
+def get_stale():
+    return getattr(settings, 'PAGE_CACHE_STALE', 300)
+
+
+def page_key(request):
+    return 'page:' + hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def version_key(dependency):
+    return f'page-version:{dependency}'
+
+
+def initial_version():
+    # see fragment_cache.initial_version
+    return time.time_ns() // 1000
+
+
+def get_versions(dependencies):
+    cache = get_cache()
+    keys = {version_key(dep): dep for dep in dependencies}
+    found = cache.get_many(keys)
+    missing = {key: initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {dep: found[key] for key, dep in keys.items()}
+
+
+def purge(*dependencies):
+    """
+    Makes every cached page built on one of dependencies stale.
+    """
+    if not enabled():
+        return
+    cache = get_cache()
+    for dep in dependencies:
+        key = version_key(dep)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), timeout=None)
+
+
+def question_dependency(question_id):
+    return f'question:{question_id}'
+
+
+def tag_dependency(tag_id):
+    return f'tag:{tag_id}'
+
+
+def purge_question(question_id, tag_ids=None):
+    """
+    The question page and every list its card is on: / and /hot and the
+    pages of its tags.
+    """
+    if not enabled():
+        return
+    if tag_ids is None:
+        tag_ids = Question.tags.through.objects.filter(question_id=question_id).values_list('tag_id', flat=True)
+    purge(question_dependency(question_id), LISTS, *(tag_dependency(pk) for pk in tag_ids))
+
+
+def purge_voted(model, object_id):
+    if not enabled():
+        return
+    if model is Question:
+        purge_question(object_id)
+        return
+    # answers are only shown on their question's page
+    question_id = Answer.objects.filter(pk=object_id).values_list('question_id', flat=True).first()
+    if question_id is not None:
+        purge(question_dependency(question_id))
+
+
+def is_fresh(entry, versions):
+    return entry['versions'] == versions and time.time() - entry['created'] < get_timeout()
+
+
+def is_cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Cache-Control')
+    )
+
+
+def wait_for(key):
+    cache = get_cache()
+    deadline = time.monotonic() + getattr(settings, 'PAGE_CACHE_LOCK_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def store(key, response, versions):
+    # validators set by the view itself are kept, so they match whether the
+    # next request is served from here or reaches the view
+    created = time.time()
+    entry = {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': response.get('ETag') or quote_etag(hashlib.md5(response.content).hexdigest()),
+        'last_modified': parse_http_date_safe(response.get('Last-Modified', '')) or int(created),
+        'created': created,
+        'versions': versions,
+    }
+    get_cache().set(key, entry, get_timeout() + get_stale())
+    return entry
+
+
+def respond(request, entry, state):
+    last_modified = entry['last_modified']
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    # the page differs once the visitor logs in, so always revalidate
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ['Cookie'])
+    response['X-Page-Cache'] = state
+    return response
+
+
+def lookup(request, dependencies, kwargs):
+    """
+    (response, ticket): a response served from the cache, or the ticket for
+    rendering and storing the page. ticket['lock'] is None when another
+    request is already rendering it and the result must not be stored.
+    """
+    cache = get_cache()
+    key = page_key(request)
+    versions = get_versions(dep.format(**kwargs) for dep in dependencies)
+    entry = cache.get(key)
+    if entry is not None and is_fresh(entry, versions):
+        return respond(request, entry, 'hit'), None
+
+    lock = f'{key}:lock'
+    if cache.add(lock, 1, 30):
+        return None, {'key': key, 'versions': versions, 'lock': lock}
+
+    # somebody else is rendering this page
+    if entry is not None:
+        return respond(request, entry, 'stale'), None
+    entry = wait_for(key)
+    if entry is not None:
+        return respond(request, entry, 'hit'), None
+    return None, {'key': key, 'versions': versions, 'lock': None}
+
+
+def finish(request, response, ticket):
+    if ticket['lock'] is None or not is_cacheable(response):
+        return response
+    # versions were read before rendering: a purge that lands meanwhile
+    # leaves this entry stale, as it should
+    entry = store(ticket['key'], response, ticket['versions'])
+    return respond(request, entry, 'miss')
+
+
+def release(ticket):
+    if ticket['lock'] is not None:
+        get_cache().delete(ticket['lock'])
+
+
+def cached_page(*dependencies):
+    """
+    @cached_page('question:{pk}', ...)
+
+    Caches the whole response of anonymous GET/HEAD requests per path and
+    query string. The entry is fresh for PAGE_CACHE_TIMEOUT seconds as long
+    as none of its dependencies (formatted with the view kwargs) is purged.
+    A stale entry is revalidated by one request while the others keep
+    getting it for up to PAGE_CACHE_STALE seconds; on a cold key the others
+    wait up to PAGE_CACHE_LOCK_WAIT seconds for the first render. Works on
+    sync and async views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not enabled() or request.method not in ('GET', 'HEAD') or (await request.auser()).is_authenticated:
+                    return await view(request, *args, **kwargs)
+
+                response, ticket = await sync_to_async(lookup)(request, dependencies, kwargs)
+                if response is not None:
+                    return response
+                try:
+                    response = await view(request, *args, **kwargs)
+                    return await sync_to_async(finish)(request, response, ticket)
+                finally:
+                    await sync_to_async(release)(ticket)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not enabled() or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            response, ticket = lookup(request, dependencies, kwargs)
+            if response is not None:
+                return response
+            try:
+                return finish(request, view(request, *args, **kwargs), ticket)
+            finally:
+                release(ticket)
+        return wrapper
+    return decorator
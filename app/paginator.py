@@ -0,0 +1,233 @@
+import base64
+import bisect
+import binascii
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, values):
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        payload.append(value)
+    raw = json.dumps({'d': direction, 'v': payload}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        direction, payload = data['d'], data['v']
+        if direction not in ('n', 'p') or not isinstance(payload, list):
+            raise InvalidCursor(cursor)
+        values = []
+        for value in payload:
+            if isinstance(value, dict):
+                value = datetime.fromisoformat(value['dt'])
+            values.append(value)
+        return direction, values
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: pages are selected with a WHERE on the ordering columns
+    of the last/first row seen instead of OFFSET, and nothing is ever counted.
+    The queryset ordering must end with a unique column (normally id).
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = self._parse_ordering(queryset.query.order_by)
+
+    @staticmethod
+    def _parse_ordering(order_by):
+        if not order_by:
+            raise ValueError('CursorPaginator needs an ordered queryset')
+        ordering = []
+        for field in order_by:
+            if not isinstance(field, str) or field == '?':
+                raise ValueError(f'Unsupported ordering for cursor pagination: {field!r}')
+            descending = field.startswith('-')
+            ordering.append((field.lstrip('-'), descending))
+        return ordering
+
+    def _keyset_filter(self, values, forward):
+        condition = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forward else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for j in range(i):
+                step &= Q(**{self.ordering[j][0]: values[j]})
+            condition |= step
+        # Redundant bound on the first column: the OR above can't start an
+        # index range scan by itself, this lets the database seek instead of
+        # walking the index from the first row.
+        field, descending = self.ordering[0]
+        return Q(**{f'{field}__{"lte" if descending == forward else "gte"}': values[0]}) & condition
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        opts = self.queryset.model._meta
+        if name == 'pk':
+            return opts.pk
+        *path, last = name.split('__')
+        for part in path:
+            opts = opts.get_field(part).related_model._meta
+        return opts.get_field(last)
+
+    def _clean(self, values):
+        # the cursor comes from the query string: every value must convert
+        # to the type of its ordering column, or the database would choke
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        cleaned = []
+        for (name, _), value in zip(self.ordering, values):
+            try:
+                value = self._field(name).to_python(value)
+            except (FieldDoesNotExist, ValidationError, TypeError, ValueError) as e:
+                raise InvalidCursor(values) from e
+            if value is None:
+                raise InvalidCursor(values)
+            cleaned.append(value)
+        return cleaned
+
+    def _values(self, obj):
+        return [getattr(obj, 'pk' if field == 'pk' else field) for field, _ in self.ordering]
+
+    def page(self, cursor=None):
+        direction, values = ('n', None)
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+                values = self._clean(values)
+            except InvalidCursor:
+                direction, values = ('n', None)
+
+        forward = direction == 'n'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._keyset_filter(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        next_cursor = encode_cursor('n', self._values(rows[-1])) if has_next and rows else None
+        previous_cursor = encode_cursor('p', self._values(rows[0])) if has_previous and rows else None
+
+        return CursorPage(rows, bool(next_cursor), bool(previous_cursor), next_cursor, previous_cursor)
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Page-number paginator whose total is counted at most up to `count_cap`
+    rows and cached for `count_timeout` seconds, so deep listings never run
+    an unbounded COUNT(*) per request. Defaults come from
+    PAGINATION_COUNT_CAP / PAGINATION_COUNT_TIMEOUT.
+    """
+
+    def __init__(self, object_list, per_page, count_cap=None, count_timeout=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_cap = count_cap or getattr(settings, 'PAGINATION_COUNT_CAP', 1000)
+        self.count_timeout = count_timeout or getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 60)
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+
+        sql = str(self.object_list.query).encode()
+        key = f'paginator-count:{hashlib.md5(sql).hexdigest()}:{self.count_cap}'
+        total = cache.get(key)
+        if total is None:
+            total = self.object_list[:self.count_cap].count()
+            cache.set(key, total, self.count_timeout)
+        return total
+
+
+class SortedKeysCursorPaginator:
+    """
+    Keyset pagination over an in-memory list of unique, ascending sort keys
+    (tuples of plain values). Used where the ordering is computed in Python,
+    e.g. the inverted-index search fallback.
+    """
+
+    def __init__(self, keys, per_page):
+        self.keys = keys
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        values = None
+        direction = 'n'
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+            except InvalidCursor:
+                values = None
+
+        start, end = 0, self.per_page
+        try:
+            if values is not None and direction == 'n':
+                start = bisect.bisect_right(self.keys, tuple(values))
+                end = start + self.per_page
+            elif values is not None:
+                end = bisect.bisect_left(self.keys, tuple(values))
+                start = max(0, end - self.per_page)
+        except TypeError:
+            # values that do not compare with the keys: first page
+            start, end = 0, self.per_page
+
+        rows = self.keys[start:end]
+        has_next = end < len(self.keys)
+        has_previous = start > 0
+        next_cursor = encode_cursor('n', list(rows[-1])) if has_next and rows else None
+        previous_cursor = encode_cursor('p', list(rows[0])) if has_previous and rows else None
+
+        return CursorPage(rows, bool(next_cursor), bool(previous_cursor), next_cursor, previous_cursor)
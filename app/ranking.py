@@ -0,0 +1,62 @@
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from app.models import HotScore, Question
+
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def hot_score(rating, answers_count, created_at):
+    """
+    Reddit-style hot score: log10 of the activity (votes plus weighted
+    answers) plus the age of the question in HOT_DECAY_SECONDS units.
+    Newer questions start higher, which is the same as older ones decaying,
+    so a stored score never has to be recomputed just because time passed.
+    """
+    answer_weight = getattr(settings, 'HOT_ANSWER_WEIGHT', 2)
+    decay = getattr(settings, 'HOT_DECAY_SECONDS', 45000)
+
+    activity = rating + answer_weight * answers_count
+    sign = (activity > 0) - (activity < 0)
+    order = math.log10(max(abs(activity), 1))
+    return round(sign * order + (created_at - EPOCH).total_seconds() / decay, 7)
+
+
+def update(question_id):
+    """
+    Recomputes the score of one question from its stored counters.
+    """
+    row = Question.objects.filter(pk=question_id).values_list('rating', 'answers_count', 'created_at').first()
+    if row is None:
+        return None
+
+    score = hot_score(*row)
+    HotScore.objects.bulk_create(
+        [HotScore(question_id=question_id, score=score)],
+        update_conflicts=True,
+        unique_fields=['question'],
+        update_fields=['score'],
+    )
+    return score
+
+
+def rebuild(batch_size=2000):
+    rows = Question.objects.order_by().values_list('id', 'rating', 'answers_count', 'created_at')
+    batch = []
+    total = 0
+    for question_id, rating, answers_count, created_at in rows.iterator(chunk_size=batch_size):
+        batch.append(HotScore(question_id=question_id, score=hot_score(rating, answers_count, created_at)))
+        if len(batch) >= batch_size:
+            total += _save(batch)
+            batch = []
+    if batch:
+        total += _save(batch)
+    return total
+
+
+def _save(batch):
+    HotScore.objects.bulk_create(batch, update_conflicts=True, unique_fields=['question'], update_fields=['score'])
+    return len(batch)
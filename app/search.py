@@ -0,0 +1,203 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from app import sql_metrics
+from app.models import Question
+from app.paginator import CursorPage, CursorPaginator, SortedKeysCursorPaginator
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+TITLE_WEIGHT = 3
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def filter_by_tags(queryset, tags):
+    for name in tags or ():
+        queryset = queryset.filter(tags__name=name)
+    return queryset
+
+
+class PostgresSearch:
+    """
+    Uses the stored, generated app_question.search_vector column and its GIN
+    index (migration 0009). PostgreSQL keeps the column current on every
+    INSERT/UPDATE, so there is nothing to maintain here.
+    """
+
+    tsquery = "websearch_to_tsquery('simple', %s)"
+
+    def search(self, query, tags=None, cursor=None, per_page=5):
+        table = Question._meta.db_table
+        questions = Question.objects.annotate(
+            # float8, so the rank survives the round trip through a cursor
+            search_rank=RawSQL(f'ts_rank_cd({table}.search_vector, {self.tsquery})::float8', [query], output_field=FloatField())
+        ).filter(
+            RawSQL(f'{table}.search_vector @@ {self.tsquery}', [query], output_field=BooleanField())
+        )
+        questions = filter_by_tags(questions, tags).for_listing().order_by('-search_rank', '-id')
+        return CursorPaginator(questions, per_page).page(cursor)
+
+    def build(self):
+        pass
+
+    def add(self, question):
+        pass
+
+
+class InvertedIndexSearch:
+    """
+    Pure-Python fallback for SQLite: an in-process inverted index
+    term -> {question_id: weight}, built on first use, updated by
+    QuestionForm.save and rebuilt by one background thread after
+    SEARCH_INDEX_MAX_AGE seconds so other worker processes catch up; the
+    old index keeps serving meanwhile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.postings = {}
+        self.documents = {}
+        self.built_at = None
+        # questions added while a build reads the database, replayed on swap
+        self.pending = None
+
+    def build(self):
+        with self.lock:
+            self.pending = []
+        postings = {}
+        documents = {}
+        rows = Question.objects.order_by().values_list('id', 'title', 'text')
+        for question_id, title, text in rows.iterator(chunk_size=2000):
+            self._index(postings, documents, question_id, title, text)
+        with self.lock:
+            for question in self.pending:
+                self._reindex(postings, documents, question)
+            self.postings, self.documents = postings, documents
+            self.pending = None
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # nothing to serve yet: the first request builds, the others wait
+            with self.build_lock, sql_metrics.cache_fill():
+                if self.built_at is None:
+                    self.build()
+            return
+        max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+        if time.monotonic() - self.built_at > max_age and self.build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, name='search-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Search index rebuild failed')
+            with self.lock:
+                self.pending = None
+                # retried after another SEARCH_INDEX_MAX_AGE
+                self.built_at = time.monotonic()
+        finally:
+            connection.close()
+            self.build_lock.release()
+
+    @staticmethod
+    def _index(postings, documents, question_id, title, text):
+        weights = Counter()
+        for term in tokenize(title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(text):
+            weights[term] += 1
+        for term, weight in weights.items():
+            postings.setdefault(term, {})[question_id] = weight
+        documents[question_id] = set(weights)
+
+    def _reindex(self, postings, documents, question):
+        for term in documents.pop(question.pk, ()):
+            postings.get(term, {}).pop(question.pk, None)
+        self._index(postings, documents, question.pk, question.title, question.text)
+
+    def add(self, question):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(question)
+            if self.built_at is not None:
+                self._reindex(self.postings, self.documents, question)
+
+    def rank(self, query):
+        """
+        Returns ascending sort keys (-score, -id) of questions containing every
+        query term, scored by term weight * idf.
+        """
+        self.ensure_built()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            lists = [self.postings.get(term, {}) for term in terms]
+            total = len(self.documents) or 1
+        lists.sort(key=len)
+        if not lists[0]:
+            return []
+
+        candidates = set(lists[0])
+        for postings in lists[1:]:
+            candidates &= postings.keys()
+
+        keys = []
+        for question_id in candidates:
+            score = sum(p[question_id] * math.log(1 + total / len(p)) for p in lists)
+            keys.append((-round(score, 6), -question_id))
+        keys.sort()
+        return keys
+
+    def search(self, query, tags=None, cursor=None, per_page=5):
+        keys = self.rank(query)
+        if tags and keys:
+            allowed = set(filter_by_tags(Question.objects.filter(pk__in=[-k[1] for k in keys]), tags).values_list('pk', flat=True))
+            keys = [k for k in keys if -k[1] in allowed]
+
+        page = SortedKeysCursorPaginator(keys, per_page).page(cursor)
+        questions = Question.objects.for_listing().in_bulk([-k[1] for k in page.object_list])
+        object_list = []
+        for score, question_id in page.object_list:
+            question = questions.get(-question_id)
+            if question is not None:
+                question.search_rank = -score
+                object_list.append(question)
+
+        return CursorPage(object_list, page.has_next, page.has_previous, page.next_cursor, page.previous_cursor)
+
+
+_backends = {}
+
+
+def get_backend():
+    vendor = connection.vendor
+    if vendor not in _backends:
+        _backends[vendor] = PostgresSearch() if vendor == 'postgresql' else InvertedIndexSearch()
+    return _backends[vendor]
+
+
+def search(query, tags=None, cursor=None, per_page=5):
+    return get_backend().search(query, tags=tags, cursor=cursor, per_page=per_page)
+
+
+def index_question(question):
+    get_backend().add(question)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from app import sql_metrics
+from app.models import Profile, Tag
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'sidebar:aggregate'
+VERSION_KEY = 'sidebar:version'
+LOCK_KEY = 'sidebar:lock'
+
+EMPTY = {'popular_tags': [], 'best_members': []}
+
+
+def get_cache():
+    return caches[getattr(settings, 'SIDEBAR_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """
+    Whether other processes see what this one stores: not for the
+    per-process local memory cache (or no cache at all).
+    """
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def compute():
+    """
+    Top tags by number of questions and top members by answers plus the
+    rating of those answers, both over the last SIDEBAR_WINDOW_DAYS.
+    """
+    since = timezone.now() - timedelta(days=getattr(settings, 'SIDEBAR_WINDOW_DAYS', 30))
+    limit_tags = getattr(settings, 'SIDEBAR_TAGS', 8)
+    limit_members = getattr(settings, 'SIDEBAR_MEMBERS', 5)
+
+    tags = (
+        Tag.objects.filter(question__created_at__gte=since)
+        .annotate(questions=Count('question'))
+        .order_by('-questions', 'name')
+        .values('id', 'name', 'questions')[:limit_tags]
+    )
+    members = (
+        Profile.objects.filter(answer__created_at__gte=since)
+        .annotate(score=Count('answer') + Coalesce(Sum('answer__rating'), 0))
+        .order_by('-score', 'id')
+        .values('id', 'user__username', 'score')[:limit_members]
+    )
+
+    return {
+        'popular_tags': list(tags),
+        'best_members': [
+            {'id': m['id'], 'name': m['user__username'], 'score': m['score']} for m in members
+        ],
+    }
+
+
+def refresh():
+    data = compute()
+    # a digest of the content: refreshes that change nothing keep it
+    digest = hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    get_cache().set_many({CACHE_KEY: data, VERSION_KEY: digest}, getattr(settings, 'SIDEBAR_CACHE_TIMEOUT', 900))
+    return data
+
+
+def version():
+    """
+    Changes whenever the cached aggregate does, for page validators.
+    """
+    return get_cache().get(VERSION_KEY, '')
+
+
+def get():
+    """
+    Cached aggregate; a cold cache is filled by one request while the others
+    render an empty sidebar instead of all running the aggregates.
+    """
+    cache = get_cache()
+    data = cache.get(CACHE_KEY)
+    if data is not None:
+        return data
+
+    if not cache.add(LOCK_KEY, 1, 30):
+        return EMPTY
+    try:
+        with sql_metrics.cache_fill():
+            return refresh()
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+class Scheduler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='sidebar-refresh', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                refresh()
+            except Exception:
+                logger.exception('Sidebar refresh failed')
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+
+
+def start_scheduler(interval=None):
+    """
+    Refreshes the aggregate every SIDEBAR_REFRESH_INTERVAL seconds from a
+    daemon thread, so the cache never expires under traffic. Started per
+    worker from gunicorn_config.post_worker_init. refresh_sidebar can do the
+    same from cron only when SIDEBAR_CACHE_ALIAS is shared between processes.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(interval or getattr(settings, 'SIDEBAR_REFRESH_INTERVAL', 300))
+        _scheduler.start()
+    return _scheduler
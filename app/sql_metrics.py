@@ -0,0 +1,227 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+_recorder = contextvars.ContextVar('sql_metrics_recorder', default=None)
+_filling = contextvars.ContextVar('sql_metrics_filling', default=False)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """
+    The query with literals, placeholders and IN lists collapsed: queries
+    differing only in their parameters share a fingerprint.
+    """
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper hook collecting what one request ran, on
+    any number of threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.fills = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            key = sql if many else (sql, _hashable(params))
+            shape = fingerprint(sql)
+            filling = _filling.get()
+            with self.lock:
+                self.duration += elapsed
+                self.count += 1
+                self.fills += filling
+                self.statements[key] += 1
+                self.fingerprints[shape] += 1
+
+    @property
+    def budgeted(self):
+        # what the view itself costs on warm caches
+        return self.count - self.fills
+
+    @property
+    def duplicates(self):
+        # the very same statement with the very same parameters
+        return sum(n - 1 for n in self.statements.values())
+
+    def similar(self):
+        # one statement shape run again and again: the N+1 signature
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+
+def _hashable(params):
+    if isinstance(params, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(_hashable(p) for p in params)
+    return params if isinstance(params, (str, int, float, bool, type(None))) else repr(params)
+
+
+def _dispatch(execute, sql, params, many, context):
+    # the recorder follows the request's context into sync_to_async threads
+    # and the pool threads of async_views.gather, whichever connection
+    # they use
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(sender=None, connection=None, **kwargs):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+connection_created.connect(install)
+
+
+@contextmanager
+def cache_fill():
+    """
+    Marks the queries inside as filling a shared cache or index (a cold
+    sidebar, the first search index build): they are reported, but not
+    held against the budget of the request that happened to run them.
+    """
+    token = _filling.set(True)
+    try:
+        yield
+    finally:
+        _filling.reset(token)
+
+
+def budget_for(request):
+    """
+    (url name, query budget or None). Budgets cover page reads only: writes
+    legitimately cost more depending on what they touch.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None
+    name = match.url_name
+    if request.method not in ('GET', 'HEAD'):
+        return name, None
+    return name, getattr(settings, 'SQL_QUERY_BUDGETS', {}).get(name)
+
+
+class QueryMetricsMiddleware:
+    """
+    Counts and times the queries of every request on all connections and
+    reports them as a Server-Timing header and a log line. Views named in
+    SQL_QUERY_BUDGETS that run more queries than allowed raise
+    QueryBudgetExceeded when SQL_BUDGET_RAISE is on (the test runner) and
+    log a warning otherwise. Queries run under cache_fill() and error
+    responses are reported but never held to a budget.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # connections opened from now on install themselves
+        for connection in connections.all(initialized_only=True):
+            install(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def report(self, request, response, recorder, elapsed):
+        similar = recorder.similar()
+        timing = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f'dup;desc="{recorder.duplicates} duplicate, {len(similar)} repeated", '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+        if recorder.fills:
+            timing += f', fill;desc="{recorder.fills} queries"'
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        name, budget = budget_for(request)
+        metrics = {
+            'path': request.path,
+            'view': name,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'cache_fills': recorder.fills,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(elapsed * 1000, 2),
+            'duplicates': recorder.duplicates,
+            'similar': [{'sql': sql[:200], 'count': n} for sql, n in similar[:5]],
+            'budget': budget,
+        }
+        logger.info(
+            'sql view=%s path=%s queries=%d db_ms=%.2f duplicates=%d similar=%d',
+            name, request.path, recorder.count, metrics['db_ms'], recorder.duplicates, len(similar),
+            extra={'sql_metrics': metrics},
+        )
+
+        # the debug 500 page runs queries of its own; raising here would hide
+        # the real error
+        if budget is not None and recorder.budgeted > budget and response.status_code < 500:
+            message = (
+                f'{name} ran {recorder.budgeted} queries, budget is {budget}; '
+                f'most repeated: {similar[:3]}'
+            )
+            if getattr(settings, 'SQL_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'sql_metrics': metrics})
@@ -0,0 +1,151 @@
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz siblings are written
+    brotli = None
+
+
+BUNDLES_DIR = 'bundles'
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map', '.xml')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def bundles():
+    return getattr(settings, 'STATIC_BUNDLES', {})
+
+
+def bundles_enabled():
+    return getattr(settings, 'STATIC_BUNDLES_ENABLED', not settings.DEBUG)
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    # a space before ':' can be a descendant combinator ("a :hover")
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    # Only indentation, blank lines and whole-line // comments go: safe for
+    # any script without multi-line template literals, which ours do not use.
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def build_bundle(name, sources, read):
+    minify = minify_css if name.endswith('.css') else minify_js
+    separator = '\n' if name.endswith('.css') else ';\n'
+    return separator.join(minify(read(source)) for source in sources) + '\n'
+
+
+class BundledManifestStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic storage: builds the STATIC_BUNDLES from the collected
+    sources, gives every file a content-hashed name and writes .gz (and .br
+    when brotli is installed) next to each compressible hashed file.
+
+    Names missing from the manifest resolve to themselves, so pages still
+    render before collectstatic has run (tests, DEBUG off in development).
+    """
+
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name, sources in bundles().items():
+            bundle = f'{BUNDLES_DIR}/{name}'
+            content = build_bundle(name, sources, self.read_text)
+            if self.exists(bundle):
+                self.delete(bundle)
+            self.save(bundle, ContentFile(content.encode()))
+            paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        for hashed in set(self.hashed_files.values()):
+            if hashed.endswith(COMPRESSIBLE):
+                self.compress(hashed)
+
+    def read_text(self, name):
+        with self.open(name) as source:
+            return source.read().decode()
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        encoders = [('gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('br', lambda d: brotli.compress(d, quality=11)))
+        for ext, encode in encoders:
+            compressed = encode(data)
+            if len(compressed) < len(data):
+                path = f'{name}.{ext}'
+                if self.exists(path):
+                    self.delete(path)
+                self.save(path, ContentFile(compressed))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def is_immutable(self, name):
+        if not hasattr(self, '_immutable'):
+            self._immutable = set(self.hashed_files.values())
+        return name in self._immutable
+
+
+def serve(request, path):
+    """
+    Serves STATIC_ROOT for deployments without a front proxy: the
+    precompressed sibling the client accepts, and a year-long immutable
+    Cache-Control for content-hashed names.
+    """
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    served = fullpath
+    for ext, name in (('br', 'br'), ('gz', 'gzip')):
+        if name in accepted and os.path.isfile(f'{fullpath}.{ext}'):
+            served, encoding = f'{fullpath}.{ext}', name
+            break
+
+    stat = os.stat(served)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    response = FileResponse(open(served, 'rb'), content_type=content_type, filename=os.path.basename(fullpath))
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if getattr(staticfiles_storage, 'is_immutable', None) and staticfiles_storage.is_immutable(path):
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = 'public, max-age=60'
+    return response
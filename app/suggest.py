@@ -0,0 +1,204 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from app import sql_metrics
+from app.models import Question, Tag
+
+
+logger = logging.getLogger(__name__)
+
+SHORT_PREFIX = 2
+TITLE_WORDS = 6
+# longer prefixes matching more entries than this get their best items
+# precomputed like the short ones
+SCAN_LIMIT = 500
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, weight, item) for prefix lookups with bisect.
+    Short prefixes, and longer ones matching more than SCAN_LIMIT entries,
+    keep their best `limit` items precomputed; the other prefixes scan their
+    bisect range, which is at most SCAN_LIMIT long.
+    """
+
+    def __init__(self, entries, limit=10):
+        self.limit = limit
+        self.keys = []
+        self.entries = []
+        for key, weight, item in sorted(entries, key=lambda e: e[0]):
+            self.keys.append(key)
+            self.entries.append((weight, item))
+        self.top = {}
+        for key, (weight, item) in zip(self.keys, self.entries):
+            self._remember(key, weight, item)
+        self._precompute_dense()
+
+    def _precompute_dense(self):
+        size = SHORT_PREFIX
+        dense = True
+        while dense:
+            size += 1
+            dense = False
+            position = 0
+            while position < len(self.keys):
+                key = self.keys[position]
+                if len(key) < size:
+                    position += 1
+                    continue
+                end = bisect.bisect_left(self.keys, key[:size] + '\uffff', lo=position)
+                if end - position > SCAN_LIMIT:
+                    self.top[key[:size]] = self._best(position, end)
+                    dense = True
+                position = end
+
+    def _best(self, start, end):
+        # an item can match through several keys (title words), its best
+        # weight counts
+        weights = {}
+        for position in range(start, end):
+            weight, item = self.entries[position]
+            if item not in weights or weights[item] < weight:
+                weights[item] = weight
+        best = heapq.nlargest(self.limit, weights.items(), key=lambda e: e[1])
+        return [(weight, item) for item, weight in best]
+
+    def _remember(self, key, weight, item):
+        for size in range(1, len(key) + 1):
+            best = self.top.get(key[:size])
+            if best is None:
+                if size > SHORT_PREFIX:
+                    # ranges only narrow from here on
+                    break
+                best = self.top[key[:size]] = []
+            if item in (i for _, i in best):
+                continue
+            best.append((weight, item))
+            best.sort(key=lambda e: -e[0])
+            del best[self.limit:]
+
+    def add(self, key, weight, item):
+        position = bisect.bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.entries.insert(position, (weight, item))
+        self._remember(key, weight, item)
+
+    def lookup(self, prefix, limit=None):
+        limit = min(limit or self.limit, self.limit)
+        best = self.top.get(prefix)
+        if best is None and len(prefix) > SHORT_PREFIX:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + '\uffff', lo=start)
+            best = self._best(start, end)
+        return [item for _, item in (best or [])[:limit]]
+
+
+class Suggestions:
+    """
+    Per-process tag and question-title indexes, loaded on first use (or from
+    gunicorn's post_worker_init) and kept current by add_tags/add_question.
+    After SUGGEST_INDEX_MAX_AGE seconds one background thread rebuilds them
+    so workers pick up each other's new tags; the old indexes keep serving
+    until the new ones are swapped in.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.tags = None
+        self.questions = None
+        self.built_at = None
+        # additions made while a build reads the database, replayed on swap
+        self.pending = None
+
+    def build(self):
+        with self.lock:
+            self.pending = []
+        limit = getattr(settings, 'SUGGEST_LIMIT', 10)
+        tag_rows = Tag.objects.annotate(weight=Count('question')).values_list('name', 'weight')
+        tags = PrefixIndex(((name.lower(), weight, name) for name, weight in tag_rows.iterator()), limit)
+
+        entries = []
+        rows = Question.objects.order_by().values_list('id', 'title', 'rating', 'answers_count')
+        for question_id, title, rating, answers_count in rows.iterator(chunk_size=2000):
+            entries.extend(self._title_entries(question_id, title, rating + answers_count))
+        questions = PrefixIndex(entries, limit)
+
+        with self.lock:
+            for names, question in self.pending:
+                self._add(tags, questions, names, question)
+            self.tags, self.questions = tags, questions
+            self.pending = None
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _title_entries(question_id, title, weight):
+        # Every word of the title starts an entry, so "migr" finds
+        # "Django migrations".
+        words = title.lower().split()
+        for i in range(min(len(words), TITLE_WORDS)):
+            yield ' '.join(words[i:]), weight, (question_id, title)
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # nothing to serve yet: the first request builds, the others wait
+            with self.build_lock, sql_metrics.cache_fill():
+                if self.built_at is None:
+                    self.build()
+            return
+        max_age = getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+        if time.monotonic() - self.built_at > max_age and self.build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, name='suggest-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Suggestion index rebuild failed')
+            with self.lock:
+                self.pending = None
+                # retried after another SUGGEST_INDEX_MAX_AGE
+                self.built_at = time.monotonic()
+        finally:
+            connection.close()
+            self.build_lock.release()
+
+    def _add(self, tags, questions, names=(), question=None):
+        for name in names:
+            tags.add(name.lower(), 0, name)
+        if question is not None:
+            for key, weight, item in self._title_entries(question.pk, question.title, 0):
+                questions.add(key, weight, item)
+
+    def _record(self, names=(), question=None):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((names, question))
+            if self.built_at is not None:
+                self._add(self.tags, self.questions, names, question)
+
+    def add_tags(self, names):
+        self._record(names=list(names))
+
+    def add_question(self, question):
+        self._record(question=question)
+
+    def tag_names(self, prefix, limit=None):
+        self.ensure_built()
+        with self.lock:
+            return self.tags.lookup(prefix.lower(), limit)
+
+    def question_titles(self, prefix, limit=None):
+        self.ensure_built()
+        with self.lock:
+            return self.questions.lookup(prefix.lower(), limit)
+
+
+suggestions = Suggestions()
@@ -0,0 +1,38 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from app import avatars
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(profile, css_class, width):
+    """
+    {% avatar profile "question_avatar" 100 %}
+
+    Картинка профиля для слота шириной width px. Когда миниатюры готовы,
+    браузер сам выбирает размер (srcset/sizes) и формат (<picture>);
+    до этого — оригинал или заглушка из Profile.avatar_url.
+    """
+    if not getattr(profile, 'avatar_thumbnails', False):
+        # пользователь без профиля приходит сюда пустой строкой
+        url = getattr(profile, 'avatar_url', None) or static('images/silly_cat.jpg')
+        return format_html('<img class="{}" src="{}" alt="Avatar">', css_class, url)
+
+    sizes = f'{width}px'
+    *preferred, (fallback, _, _) = avatars.FORMATS
+    sources = format_html_join('', '<source type="image/{}" srcset="{}" sizes="{}">', (
+        (ext, srcset(profile, ext), sizes) for ext, _, _ in preferred
+    ))
+    urls = profile.avatar_thumbnail_urls(fallback)
+    src = next((url for url, size in urls if size >= width), urls[-1][0])
+    return format_html(
+        '<picture class="avatar-picture">{}<img class="{}" src="{}" srcset="{}" sizes="{}" alt="Avatar"></picture>',
+        sources, css_class, src, srcset(profile, fallback), sizes,
+    )
+
+
+def srcset(profile, ext):
+    return ', '.join(f'{url} {size}w' for url, size in profile.avatar_thumbnail_urls(ext))
@@ -0,0 +1,28 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from app import staticfiles
+
+register = template.Library()
+
+TAGS = {
+    '.css': '<link rel="stylesheet" href="{}">',
+    '.js': '<script src="{}" defer></script>',
+}
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    {% bundle "listing.css" %}
+
+    Подключает бандл из settings.STATIC_BUNDLES одним файлом, собранным
+    collectstatic, а в режиме отладки — исходные файлы по отдельности.
+    """
+    if staticfiles.bundles_enabled():
+        paths = [f'{staticfiles.BUNDLES_DIR}/{name}']
+    else:
+        paths = staticfiles.bundles()[name]
+    tag = TAGS['.css' if name.endswith('.css') else '.js']
+    return format_html_join('\n', tag, ((static(path),) for path in paths))
@@ -0,0 +1,51 @@
+from django import template
+
+from app import fragment_cache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, obj, name, vary_on):
+        self.nodelist = nodelist
+        self.obj = obj
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        obj = self.obj.resolve(context)
+        name = self.name.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+
+        cache = fragment_cache.get_cache()
+        key = fragment_cache.fragment_key(obj, name, vary_on)
+        html = cache.get(key)
+        fragment_cache.record(html is not None)
+
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, fragment_cache.get_timeout())
+        return html
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    {% fragment obj "name" [vary_on ...] %} ... {% endfragment %}
+
+    Caches the enclosed HTML under obj's fragment version, so it is
+    re-rendered only after fragment_cache.bump(obj) or when a vary_on value
+    changes. Anything that depends on the current user must stay outside.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires an object and a fragment name")
+
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -1,5 +1,4 @@
 from django import template
-from app.models import Like
 
 register = template.Library()
 
@@ -8,17 +7,11 @@ def get_user_vote(obj, user):
     """
     Принимает объект (вопрос/ответ) и пользователя (request.user).
     Возвращает 1, -1 или 0.
+
+    Голос берётся из obj.user_vote, который заранее проставляет
+    app.models.attach_user_votes — тег в базу не ходит.
     """
     if not user.is_authenticated:
         return 0
-    
-    try:
-        profile = user.profile
-    except:
-        return 0
 
-    like = obj.likes.filter(user=profile).first()
-    
-    if like:
-        return like.vote
-    return 0
\ No newline at end of file
+    return getattr(obj, 'user_vote', 0)
@@ -1,41 +1,69 @@
+import hashlib
+import time
+
 from django.contrib import auth
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
-from django.contrib.contenttypes.models import ContentType
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.conf import settings as django_settings
+from django.db.models import QuerySet
 from django.urls import reverse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.contrib.staticfiles.storage import staticfiles_storage
+from app import fragment_cache, page_cache, ranking, search as question_search, sidebar, vote_buffer
+from app.page_cache import cached_page
 from app.forms import AnswerForm, LoginForm, QuestionForm, RegisterForm, SettingsForm
-from app.models import Answer, Question, Like, Tag
-from django.db.models import Sum
+from app.models import Answer, Question, Tag, Vote, attach_user_votes
+from app.suggest import suggestions
+from app.paginator import CappedCountPaginator, CursorPaginator
+
+def use_cursor(request):
+    # Keyset pagination unless ?page= is asked for explicitly or
+    # PAGINATION_MODE is set to 'page'.
+    mode = getattr(django_settings, 'PAGINATION_MODE', 'cursor')
+    return mode == 'cursor' and 'page' not in request.GET
+
+def add_cursor_links(request, page):
+    params = request.GET.copy()
+    params.pop('page', None)
+    for attr, cursor in (('next_query', page.next_cursor), ('previous_query', page.previous_cursor)):
+        params['cursor'] = cursor or ''
+        setattr(page, attr, params.urlencode())
+    return page
 
 def paginate(request, objects, per_page=5):
-    page_num = int(request.GET.get('page', 1))
-    paginator = Paginator(objects, per_page)
-    try:
-        page = paginator.page(page_num)
-    except PageNotAnInteger:
-        page = paginator.page(1)
-    except EmptyPage:
-        page = paginator.page(paginator.num_pages)
-    return page
+    if use_cursor(request) and isinstance(objects, QuerySet) and objects.ordered:
+        page = CursorPaginator(objects, per_page).page(request.GET.get('cursor'))
+        return add_cursor_links(request, page)
+
+    return CappedCountPaginator(objects, per_page).get_page(request.GET.get('page', 1))
 
+def attach_votes(request, objects):
+    attach_user_votes(request.user, objects)
+    if vote_buffer.enabled():
+        vote_buffer.get_buffer().merge(request.user, objects)
+
+@cached_page(page_cache.LISTS)
 def index(request):
-    questions = Question.objects.new()
+    questions = Question.objects.new().for_listing()
 
     page = paginate(request, questions)
+    attach_votes(request, page.object_list)
+    fragment_cache.attach_versions(page.object_list)
 
     return render(request, 'index.html', context={
         'questions': page.object_list,
         'page_obj': page,
     })
 
+@cached_page(page_cache.LISTS)
 def hot_questions(request):
-    questions = Question.objects.popular()
+    questions = Question.objects.hot().for_listing()
 
     page = paginate(request, questions)
+    attach_votes(request, page.object_list)
+    fragment_cache.attach_versions(page.object_list)
 
     return render(request, 'hot_questions.html', context={
         'questions': page.object_list,
@@ -54,35 +82,75 @@ def ask(request):
 
     return render(request, 'ask.html', {'form': form})
 
-def question(request, pk):
-    question = Question.objects.get_with_answers(pk)
-    answers = answers = getattr(question, 'answers_ordered', [])
-    answers_cnt = getattr(question, 'answers_cnt', len(answers))
-    page = paginate(request, answers)
-    
-    return render(request, 'question.html', context={
-        'answers_cnt': answers_cnt,
-        'question': question,
-        'answers': page.object_list,
-        'page_obj': page,
-    })
-
+@cached_page('tag:{pk}')
 def tag(request, pk):
     tag_item = Tag.objects.get_by_id(pk)
 
     if tag_item is None:
         raise Http404("Tag does not exist")
 
-    questions = Question.objects.tagged(tag_item)
+    return tag_listing(request, [tag_item])
+
+def tags(request, names):
+    # /tag/python,django: questions tagged with all of them. Commas separate
+    # tags in QuestionForm too, so no name has one; '+' does appear (c++).
+    names = list(dict.fromkeys(name for name in names.lower().split(',') if name))
+    by_name = {tag_item.name: tag_item for tag_item in Tag.objects.filter(name__in=names)}
+
+    if not names or len(by_name) != len(names):
+        raise Http404("Tag does not exist")
+
+    return tag_listing(request, [by_name[name] for name in names])
+
+def tag_listing(request, tag_items):
+    questions = Question.objects.tagged(*tag_items).for_listing()
 
     page = paginate(request, questions)
+    attach_votes(request, page.object_list)
+    fragment_cache.attach_versions(page.object_list)
 
     return render(request, 'tag.html', context={
         'questions': page.object_list,
         'page_obj': page,
-        'tag': tag_item,
+        'tag': tag_items[0],
+        'tags': tag_items,
+    })
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    tags = [t for t in request.GET.getlist('tag') if t]
+
+    page = question_search.search(query, tags=tags, cursor=request.GET.get('cursor')) if query else None
+    if page is not None:
+        add_cursor_links(request, page)
+        attach_votes(request, page.object_list)
+        fragment_cache.attach_versions(page.object_list)
+
+    return render(request, 'search.html', context={
+        'query': query,
+        'tags': tags,
+        'questions': page.object_list if page is not None else [],
+        'page_obj': page,
     })
 
+def suggest(request):
+    prefix = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', 'tags')
+    if not prefix:
+        return JsonResponse({'results': []})
+
+    if kind == 'tags':
+        results = [{'name': name} for name in suggestions.tag_names(prefix)]
+    elif kind == 'questions':
+        results = [
+            {'id': pk, 'title': title, 'url': reverse('question', args=[pk])}
+            for pk, title in suggestions.question_titles(prefix)
+        ]
+    else:
+        return JsonResponse({'error': 'Wrong kind'}, status=400)
+
+    return JsonResponse({'results': results})
+
 def settings(request):
     return render(request, 'settings.html')
 
@@ -129,19 +197,52 @@ def logout(request):
     
     return HttpResponseRedirect(reverse('index'))
 
+def question_modified(request, pk):
+    # one indexed query, cached on the request for both validators
+    if request.method not in ('GET', 'HEAD') or vote_buffer.enabled():
+        # buffered votes show on the page before they reach updated_at
+        return None
+    if not hasattr(request, 'question_modified'):
+        request.question_modified = Question.objects.last_modified(pk)
+    return request.question_modified
+
+def question_etag(request, pk):
+    modified = question_modified(request, pk)
+    if modified is None:
+        return None
+    # The page also shows who is looking, links the current static build,
+    # has the sidebar and the question's cached fragments; answer fragments
+    # only move together with updated_at. Changes to the authors' names and
+    # avatars are not versioned: the time window bounds how long a 304 can
+    # keep them stale.
+    window = int(time.time() // getattr(django_settings, 'QUESTION_ETAG_MAX_AGE', 300))
+    salt = ':'.join(str(part) for part in [
+        request.user.pk or '',
+        getattr(staticfiles_storage, 'manifest_hash', ''),
+        sidebar.version(),
+        fragment_cache.get_version(Question(pk=pk)),
+        window,
+    ])
+    return hashlib.md5(f'{modified.isoformat()}:{salt}'.encode()).hexdigest()
+
+@cached_page('question:{pk}')
+@condition(etag_func=question_etag, last_modified_func=question_modified)
 def question(request, pk):
-    q = Question.objects.get_with_answers(pk)
+    try:
+        if use_cursor(request):
+            q = Question.objects.get_with_answers(pk, cursor=request.GET.get('cursor'))
+            page = add_cursor_links(request, q.answers_page)
+        else:
+            q = Question.objects.get_with_answers(pk, page=request.GET.get('page', 1))
+            page = q.answers_page
+    except Question.DoesNotExist:
+        raise Http404("Question does not exist")
     
     if request.method == 'POST':
         if request.user.is_authenticated:
             form = AnswerForm(request.POST)
             if form.is_valid():
-                answer = form.save(commit=False)
-                answer.question = q
-                
-                answer.user = request.user.profile 
-                
-                answer.save()
+                form.save(question=q, user=request.user.profile)
                 
                 return redirect('question', pk=q.id)
         else:
@@ -149,12 +250,11 @@ def question(request, pk):
     else:
         form = AnswerForm()
 
-    answers = getattr(q, 'answers_ordered', [])
-    answers_cnt = getattr(q, 'answers_cnt', len(answers))
-    page = paginate(request, answers)
+    attach_votes(request, [q, *page.object_list])
+    fragment_cache.attach_versions([q, *page.object_list])
     
     return render(request, 'question.html', context={
-        'answers_cnt': answers_cnt,
+        'answers_cnt': q.answers_count,
         'question': q,
         'answers': page.object_list,
         'page_obj': page,
@@ -175,44 +275,70 @@ def settings(request):
     
     return render(request, 'settings.html', {'form': form})
 
-@require_POST
-@login_required(login_url='login')
-def vote(request):
+def parse_vote(request):
+    """
+    (model, object id, vote value) from the POST, or an error response.
+    """
     data_id = request.POST.get('data_id')
     vote_type = request.POST.get('vote_type')
     obj_type = request.POST.get('obj_type', 'question')
 
     if obj_type == 'question':
         model = Question
-        obj = get_object_or_404(Question, pk=data_id)
     elif obj_type == 'answer':
         model = Answer
-        obj = get_object_or_404(Answer, pk=data_id)
     else:
         return JsonResponse({'error': 'Wrong object type'}, status=400)
 
-    content_type = ContentType.objects.get_for_model(obj)
-    user = request.user.profile
+    if vote_type not in ('like', 'dislike', 'none'):
+        return JsonResponse({'error': 'Wrong vote type'}, status=400)
+
+    try:
+        object_id = int(data_id)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Wrong object id'}, status=400)
+
+    return model, object_id, {'like': Vote.LIKE, 'dislike': Vote.DISLIKE, 'none': 0}[vote_type]
+
+def save_vote(profile, model, object_id, val):
+    """
+    Returns the new rating; raises model.DoesNotExist.
+    """
+    if vote_buffer.enabled():
+        # the flusher bumps fragments and hot scores once per batch
+        return vote_buffer.get_buffer().submit_vote(profile, model, object_id, val)
+
+    votes = Vote.for_model(model).objects
+    if val == 0:
+        return votes.remove_vote(profile, object_id)
+    return votes.set_vote(profile, object_id, val)
+
+def voted(model, object_id):
+    fragment_cache.bump(model(pk=object_id))
+    page_cache.purge_voted(model, object_id)
+    if model is Question:
+        ranking.update(object_id)
 
-    val = 1 if vote_type == 'like' else -1
+@require_POST
+@login_required(login_url='login')
+def vote(request):
+    parsed = parse_vote(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    model, object_id, val = parsed
 
     try:
-        like_obj, created = Like.objects.update_or_create(
-            user=user,
-            content_type=content_type,
-            object_id=obj.id,
-            defaults={'vote': val}
-        )
-        
-        new_rating = obj.likes.aggregate(Sum('vote'))['vote__sum'] or 0
+        new_rating = save_vote(request.user.profile, model, object_id, val)
+    except model.DoesNotExist:
+        raise Http404(f"{model.__name__} does not exist")
 
-        return JsonResponse({
-            'new_rating': new_rating,
-            'user_vote': val
-        })
+    if not vote_buffer.enabled():
+        voted(model, object_id)
 
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'new_rating': new_rating,
+        'user_vote': val
+    })
 
 @login_required
 @require_POST
@@ -227,9 +353,14 @@ def mark_correct(request):
     if answer.is_correct:
         answer.is_correct = False
         answer.save()
+        fragment_cache.bump(answer)
+        page_cache.purge(page_cache.question_dependency(question.pk))
         return JsonResponse({'status': 'ok', 'is_correct': False})
     else:
+        previous = list(question.answer_set.filter(is_correct=True))
         question.answer_set.update(is_correct=False)
         answer.is_correct = True
         answer.save()
+        fragment_cache.bump(answer, *previous)
+        page_cache.purge(page_cache.question_dependency(question.pk))
         return JsonResponse({'status': 'ok', 'is_correct': True})
\ No newline at end of file
@@ -0,0 +1,368 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import secrets
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app import fragment_cache, page_cache, ranking
+from app.models import Question, Vote
+
+
+logger = logging.getLogger(__name__)
+
+RETRACT = 0
+
+
+def enabled():
+    return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for votes. Votes are kept per process keyed by
+    (profile_id, kind, object_id), kind being the voted model's name
+    ("question" or "answer"), last write wins, and written by
+    flush() in one transaction: a bulk upsert of the votes plus one rating
+    UPDATE per touched object, with deltas computed against the stored votes
+    at flush time.
+
+    Every accepted vote is appended to a journal file first, named after the
+    process id and a random token of this buffer. A journal left behind by a
+    dead process is replayed by the next buffer that starts, even one that
+    got the same pid; replaying is harmless because flush() recomputes
+    deltas from the database.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, journal_dir=None, interval=None):
+        self.journal_dir = journal_dir or getattr(settings, 'VOTE_BUFFER_JOURNAL_DIR', None)
+        self.interval = interval or getattr(settings, 'VOTE_BUFFER_INTERVAL', 1.0)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.deltas = defaultdict(int)
+        self.flushing_deltas = {}
+        self.journal = None
+        # pids get reused (pid 1 of a restarted container): the token tells
+        # this buffer's journal from a dead predecessor's
+        self.token = secrets.token_hex(4)
+        self.recovered = []
+        self.thread = None
+        self.stopped = threading.Event()
+
+    # journal
+
+    def _journal_path(self, suffix='log'):
+        return os.path.join(self.journal_dir, f'votes-{os.getpid()}-{self.token}.{suffix}')
+
+    def _open_journal(self):
+        if self.journal_dir and self.journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self.journal = open(self._journal_path(), 'a', buffering=1)
+
+    def _write_journal(self, key, vote):
+        if self.journal is not None:
+            self.journal.write(json.dumps([*key, vote]) + '\n')
+
+    def recover(self):
+        """
+        Loads journals of processes that are gone into this buffer.
+        """
+        if not self.journal_dir:
+            return 0
+        loaded = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'votes-*'))):
+            # votes-<pid>-<token>.<suffix>, or votes-<pid>.<suffix> before tokens
+            pid, _, token = os.path.basename(path).split('.')[0][len('votes-'):].partition('-')
+            pid = int(pid)
+            if pid == os.getpid():
+                if token == self.token:
+                    continue
+            elif _alive(pid):
+                continue
+            claimed = self._journal_path(f'recovered-{len(self.recovered)}')
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # another worker claimed it first
+            self.recovered.append(claimed)
+            with open(claimed) as journal:
+                for line in journal:
+                    try:
+                        profile_id, kind, object_id, vote = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    with self.lock:
+                        self.pending[(profile_id, kind, object_id)] = vote
+                    loaded += 1
+        return loaded
+
+    # writes
+
+    def submit(self, profile_id, kind, object_id, vote, stored_vote):
+        """
+        Queues a vote (RETRACT to remove it) and returns the change it makes to
+        the rating seen by readers. stored_vote is the vote currently in the
+        database, used only if nothing is pending for this key.
+        """
+        key = (profile_id, kind, object_id)
+        with self.lock:
+            self._write_journal(key, vote)
+            previous = self.pending.get(key, stored_vote or RETRACT)
+            self.pending[key] = vote
+            delta = vote - previous
+            self.deltas[(kind, object_id)] += delta
+        return delta
+
+    def submit_vote(self, profile, model, object_id, vote):
+        """
+        Buffered counterpart of VoteManager.set_vote/remove_vote: two indexed
+        reads, no writes. Returns the rating readers will see.
+        """
+        kind = model._meta.model_name
+        rating = model.objects.filter(pk=object_id).values_list('rating', flat=True).first()
+        if rating is None:
+            raise model.DoesNotExist
+        votes = Vote.for_model(model).objects
+        stored_vote = dict(votes.for_user(profile, [object_id])).get(object_id)
+        self.submit(profile.pk, kind, object_id, vote, stored_vote)
+        return rating + self.pending_delta(kind, object_id)
+
+    # reads
+
+    def pending_vote(self, profile_id, kind, object_id):
+        with self.lock:
+            return self.pending.get((profile_id, kind, object_id))
+
+    def pending_delta(self, kind, object_id):
+        key = (kind, object_id)
+        with self.lock:
+            return self.deltas.get(key, 0) + self.flushing_deltas.get(key, 0)
+
+    def merge(self, user, objects):
+        """
+        Applies pending votes to objects loaded from the database: rating gets
+        the pending delta, user_vote the user's pending vote.
+        """
+        profile = getattr(user, 'profile', None) if user.is_authenticated else None
+        with self.lock:
+            if not self.pending and not self.flushing_deltas:
+                return objects
+            for obj in objects:
+                kind = obj._meta.model_name
+                key = (kind, obj.pk)
+                obj.rating += self.deltas.get(key, 0) + self.flushing_deltas.get(key, 0)
+                if profile is not None:
+                    vote = self.pending.get((profile.pk, kind, obj.pk))
+                    if vote is not None:
+                        obj.user_vote = vote
+        return objects
+
+    # flushing
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, {}
+                self.flushing_deltas, self.deltas = self.deltas, defaultdict(int)
+                flushing = None
+                if self.journal is not None:
+                    # new votes go to a fresh journal while this one is written
+                    self.journal.close()
+                    flushing = self._journal_path('flushing')
+                    os.replace(self.journal.name, flushing)
+                    self.journal = None
+                    self._open_journal()
+
+            try:
+                touched = self._write(batch)
+            except Exception:
+                # put the batch back under anything submitted meanwhile
+                with self.lock:
+                    for key, vote in batch.items():
+                        if key not in self.pending:
+                            self.pending[key] = vote
+                            self._write_journal(key, vote)
+                    for key, delta in self.flushing_deltas.items():
+                        self.deltas[key] += delta
+                    self.flushing_deltas = {}
+                if flushing:
+                    os.remove(flushing)
+                raise
+
+            if flushing:
+                os.remove(flushing)
+            for path in self.recovered:
+                os.remove(path)
+            self.recovered = []
+
+            self._after_write(touched)
+            return len(batch)
+
+    def _load_stored(self, batch):
+        # One query per kind and chunk of profiles; the filter is a superset
+        # of the batch, the dict lookup below keeps only its keys.
+        grouped = defaultdict(lambda: (set(), set()))
+        for profile_id, kind, object_id in batch:
+            profiles, objects = grouped[kind]
+            profiles.add(profile_id)
+            objects.add(object_id)
+
+        stored = {}
+        for kind, (profiles, objects) in grouped.items():
+            votes = vote_model(kind).objects
+            attname = votes.target_field.attname
+            profiles = sorted(profiles)
+            for start in range(0, len(profiles), self.chunk_size):
+                rows = votes.select_for_update().filter(
+                    user_id__in=profiles[start:start + self.chunk_size],
+                    **{f'{attname}__in': objects},
+                )
+                for row in rows:
+                    key = (row.user_id, kind, getattr(row, attname))
+                    if key in batch:
+                        stored[key] = row
+        return stored
+
+    def _clear_flushing(self, flushing_deltas):
+        with self.lock:
+            if self.flushing_deltas is flushing_deltas:
+                self.flushing_deltas = {}
+
+    def _write(self, batch):
+        with transaction.atomic():
+            # the written ratings include these deltas once committed: from
+            # then on readers must not add them again
+            transaction.on_commit(partial(self._clear_flushing, self.flushing_deltas))
+            stored = self._load_stored(batch)
+
+            upserts = defaultdict(list)
+            retracts = defaultdict(list)
+            rating_deltas = defaultdict(int)
+            for key, vote in batch.items():
+                profile_id, kind, object_id = key
+                row = stored.get(key)
+                if vote == RETRACT:
+                    # deleting goes through the vote_deleted signal, which
+                    # takes the vote back from the rating
+                    if row is not None:
+                        retracts[kind].append(row.pk)
+                    continue
+                rating_deltas[(kind, object_id)] += vote - (row.vote if row else 0)
+                model = vote_model(kind)
+                upserts[kind].append(model(user_id=profile_id, vote=vote, **{model.objects.target_field.attname: object_id}))
+
+            for kind, rows in upserts.items():
+                model = vote_model(kind)
+                model.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=[model.TARGET, 'user'],
+                    update_fields=['vote'],
+                    batch_size=self.chunk_size,
+                )
+            for kind, pks in retracts.items():
+                vote_model(kind).objects.filter(pk__in=pks).delete()
+
+            for (kind, object_id), delta in rating_deltas.items():
+                if delta:
+                    target_model(kind).objects.filter(pk=object_id).update(
+                        rating=F('rating') + delta, updated_at=timezone.now()
+                    )
+
+        return {(kind, object_id) for _, kind, object_id in batch}
+
+    def _after_write(self, touched):
+        for kind, object_id in touched:
+            model = target_model(kind)
+            fragment_cache.bump(model(pk=object_id))
+            page_cache.purge_voted(model, object_id)
+            if model is Question:
+                ranking.update(object_id)
+
+    # background flusher
+
+    def start(self):
+        if self.thread is not None:
+            return self
+        self.recover()
+        self._open_journal()
+        self.thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Vote buffer flush failed, will retry')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """
+        Stops the flusher and writes whatever is pending. If the final flush
+        fails the journal stays on disk for the next process.
+        """
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=self.interval * 2)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Final vote buffer flush failed, journal kept for recovery')
+        if self.journal is not None:
+            self.journal.close()
+            if os.path.getsize(self.journal.name) == 0:
+                os.remove(self.journal.name)
+            self.journal = None
+
+
+def target_model(kind):
+    return apps.get_model('app', kind)
+
+
+def vote_model(kind):
+    return Vote.for_model(target_model(kind))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer().start()
+        return _buffer
+
+
+def shutdown():
+    if _buffer is not None:
+        _buffer.stop()
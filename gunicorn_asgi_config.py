@@ -0,0 +1,30 @@
+command = '/home/shatentt/Documents/prog/web/MyQuestion/.venv/bin/gunicorn'
+
+pythonpath = '/home/shatentt/Documents/prog/web/MyQuestion'
+
+bind = "127.0.0.1:8000"
+
+wsgi_app = 'web_project.asgi:application'
+
+# uvicorn's worker for gunicorn (pip install uvicorn-worker): one event loop
+# per process serves many requests while their queries wait on the database
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+workers = 2
+
+raw_env = ['ASYNC_VIEWS=1']
+
+
+def post_worker_init(worker):
+    from app import sidebar, vote_buffer
+    from app.suggest import suggestions
+    sidebar.start_scheduler()
+    suggestions.build()
+    if vote_buffer.enabled():
+        vote_buffer.get_buffer()
+
+
+def worker_exit(server, worker):
+    from app import avatars, vote_buffer
+    vote_buffer.shutdown()
+    avatars.shutdown()
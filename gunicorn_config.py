@@ -4,4 +4,19 @@ pythonpath = '/home/shatentt/Documents/prog/web/MyQuestion'
 
 bind = "127.0.0.1:8000"
 
-workers = 2
\ No newline at end of file
+workers = 2
+
+
+def post_worker_init(worker):
+    from app import sidebar, vote_buffer
+    from app.suggest import suggestions
+    sidebar.start_scheduler()
+    suggestions.build()
+    if vote_buffer.enabled():
+        vote_buffer.get_buffer()
+
+
+def worker_exit(server, worker):
+    from app import avatars, vote_buffer
+    vote_buffer.shutdown()
+    avatars.shutdown()
@@ -13,79 +13,78 @@ function getCookie(name) {
     return cookieValue;
 }
 
-$(document).ready(function() {
-    $('.js-vote').click(function() {
-        const $btn = $(this);
-        const questionId = $btn.data('id');
-        const voteType = $btn.data('type');
-        const objType = $btn.data('obj');
-        
-        const $container = $btn.closest('.rate');
-        const $btnLike = $container.find('[data-type="like"]');
-        const $btnDislike = $container.find('[data-type="dislike"]');
+function post(url, data) {
+    return fetch(url, {
+        method: 'POST',
+        headers: {'X-CSRFToken': getCookie('csrftoken')},
+        body: new URLSearchParams(data),
+    }).then((response) => {
+        if (!response.ok) {
+            const error = new Error(response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return response.json();
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.js-vote').forEach(function(btn) {
+        btn.addEventListener('click', function() {
+            const container = btn.closest('.rate');
+            const btnLike = container.querySelector('[data-type="like"]');
+            const btnDislike = container.querySelector('[data-type="dislike"]');
 
-        $.ajax({
-            url: '/vote/',
-            type: 'POST',
-            data: {
-                'data_id': questionId,
-                'vote_type': voteType,
-                'obj_type': objType,
-            },
-            headers: {'X-CSRFToken': getCookie('csrftoken')},
-            
-            success: function(response) {
+            post('/vote/', {
+                'data_id': btn.dataset.id,
+                'vote_type': btn.dataset.type,
+                'obj_type': btn.dataset.obj,
+            }).then(function(response) {
                 console.log("Success:", response);
 
                 if (response.new_rating !== undefined) {
-                    $btn.closest('.question-answer__likes').find('.like_count').text(response.new_rating);
+                    btn.closest('.question-answer__likes').querySelector('.like_count').textContent = response.new_rating;
 
                     const userVote = response.user_vote;
-                    
+
                     if (userVote === 1) {
-                        $btnLike.prop('disabled', true);
-                        $btnDislike.prop('disabled', false);
+                        btnLike.disabled = true;
+                        btnDislike.disabled = false;
                     } else if (userVote === -1) {
-                        $btnLike.prop('disabled', false);
-                        $btnDislike.prop('disabled', true);
+                        btnLike.disabled = false;
+                        btnDislike.disabled = true;
                     }
                 }
-            },
-            error: function(xhr, status, error) {
-                if (xhr.status === 403 || xhr.status === 401) {
+            }).catch(function(error) {
+                if (error.status === 403 || error.status === 401) {
                     window.location.href = '/login/?next=' + window.location.pathname;
                 } else {
                     console.log('Error: ' + error);
                 }
-            }
+            });
         });
     });
-    $('.js-correct').change(function() {
-        const $checkbox = $(this);
-        const answerId = $checkbox.data('aid');
-        
-        $.ajax({
-            url: '/correct/',
-            type: 'POST',
-            data: {
-                'answer_id': answerId,
-            },
-            headers: {'X-CSRFToken': getCookie('csrftoken')},
-            
-            success: function(response) {
+    document.querySelectorAll('.js-correct').forEach(function(checkbox) {
+        checkbox.addEventListener('change', function() {
+            post('/correct/', {
+                'answer_id': checkbox.dataset.aid,
+            }).then(function(response) {
                 if (response.status === 'ok') {
                     if (response.is_correct) {
-                        $('.js-correct').not($checkbox).prop('checked', false);
+                        document.querySelectorAll('.js-correct').forEach(function(other) {
+                            if (other !== checkbox) {
+                                other.checked = false;
+                            }
+                        });
                     }
                 } else {
                     console.log("Error logic:", response);
                 }
-            },
-            error: function(xhr, status, error) {
+            }).catch(function(error) {
                 console.log("AJAX Error:", error);
-                $checkbox.prop('checked', !$checkbox.prop('checked'));
+                checkbox.checked = !checkbox.checked;
                 alert("Something went wrong or you don't have permission.");
-            }
+            });
         });
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,38 @@
+(function(){
+    const DELAY = 100;
+
+    function attach(input) {
+        const kind = input.dataset.suggest;
+        const list = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        let lastPrefix = null;
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                // для тегов дополняем только последнее слово
+                const words = input.value.split(' ');
+                const prefix = kind === 'tags' ? words[words.length - 1] : input.value;
+                const head = kind === 'tags' ? words.slice(0, -1).join(' ') : '';
+
+                if (!prefix.trim() || prefix === lastPrefix) return;
+                lastPrefix = prefix;
+
+                fetch('/suggest?kind=' + kind + '&q=' + encodeURIComponent(prefix))
+                    .then((response) => response.json())
+                    .then((data) => {
+                        list.innerHTML = '';
+                        for (const item of data.results || []) {
+                            const option = document.createElement('option');
+                            const text = kind === 'tags' ? item.name : item.title;
+                            option.value = head ? head + ' ' + text : text;
+                            list.appendChild(option);
+                        }
+                    })
+                    .catch((error) => console.log('Suggest error:', error));
+            }, DELAY);
+        });
+    }
+
+    document.querySelectorAll('[data-suggest]').forEach(attach);
+})();
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.sql_metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.sidebar',
             ],
         },
     },
@@ -83,10 +86,113 @@ DATABASES = {
         'PASSWORD': '123123',
         'HOST': 'localhost',
         'PORT': '5432',
+        # async views read on several connections per request (app/async_views.py),
+        # opening one per query is slower than the query
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'myquestion',
+    }
+}
+
+# Rendered question/answer card fragments, see app/fragment_cache.py
+FRAGMENT_CACHE_ALIAS = 'default'
+
+FRAGMENT_CACHE_TIMEOUT = 300
+
+# Whole pages for anonymous visitors, see app/page_cache.py. Purges only
+# reach other workers when the alias is a shared cache.
+PAGE_CACHE_ENABLED = True
+
+PAGE_CACHE_ALIAS = 'default'
+
+PAGE_CACHE_TIMEOUT = 60
+
+PAGE_CACHE_STALE = 300
+
+PAGE_CACHE_LOCK_WAIT = 2
+
+# The question page's ETag follows the thread, the sidebar and the cached
+# fragments; author name and avatar changes show after at most this long.
+QUESTION_ETAG_MAX_AGE = 300
+
+
+# Hot ranking, see app/ranking.py: an answer counts as HOT_ANSWER_WEIGHT
+# votes and every HOT_DECAY_SECONDS of age costs a factor of 10 in votes.
+HOT_ANSWER_WEIGHT = 2
+
+HOT_DECAY_SECONDS = 45000
+
+
+# Sidebar "Popular Tags" / "Best Members", see app/sidebar.py
+SIDEBAR_WINDOW_DAYS = 30
+
+SIDEBAR_TAGS = 8
+
+SIDEBAR_MEMBERS = 5
+
+# refresh_sidebar (cron) needs an alias shared between processes; with
+# the local memory cache every worker refreshes its own copy instead
+SIDEBAR_CACHE_ALIAS = 'default'
+
+SIDEBAR_CACHE_TIMEOUT = 900
+
+SIDEBAR_REFRESH_INTERVAL = 300
+
+
+# Search, see app/search.py. PostgreSQL uses the search_vector column,
+# other databases an in-process index rebuilt after this many seconds.
+SEARCH_INDEX_MAX_AGE = 300
+
+# Typeahead for the search box and tag input, see app/suggest.py
+SUGGEST_LIMIT = 10
+
+SUGGEST_INDEX_MAX_AGE = 300
+
+# Buffered voting, see app/vote_buffer.py: votes are queued per process and
+# written every VOTE_BUFFER_INTERVAL seconds. Each worker journals its queue
+# under VOTE_BUFFER_JOURNAL_DIR so a crashed worker's votes are replayed.
+VOTE_BUFFER_ENABLED = False
+
+VOTE_BUFFER_INTERVAL = 1.0
+
+VOTE_BUFFER_JOURNAL_DIR = os.path.join(BASE_DIR, 'var', 'vote_buffer')
+
+# Per-request SQL metrics, see app/sql_metrics.py: every response carries a
+# Server-Timing header with the query count and time. GET requests to the
+# url names below may run at most that many queries (a logged-in user costs
+# two: session and user, page number mode one more for the count). Filling
+# a cold sidebar or search index is not counted. Over budget raises with
+# SQL_BUDGET_RAISE, on under the test runner only, and logs a warning
+# otherwise.
+SQL_QUERY_BUDGETS = {
+    'index': 7,
+    'hot_questions': 7,
+    'question': 9,
+    'tag': 8,
+    'tags': 8,
+    'search': 6,
+    'suggest': 2,
+}
+
+SQL_BUDGET_RAISE = sys.argv[1:2] == ['test']
+
+# Avatar thumbnails, see app/avatars.py: uploads are stored under their
+# content hash and resized by AVATAR_WORKERS background threads (0 resizes
+# inside the request). Thumbnail names never change meaning, so
+# MEDIA_URL/profile_pics/thumbs/ can be served with far-future expiry.
+AVATAR_WORKERS = 2
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -139,6 +245,51 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static')
 ]
 
+# collectstatic builds these bundles (minified, under static/bundles/), then
+# hashes every file and writes .gz/.br siblings, see app/staticfiles.py.
+# Templates include them with {% bundle %}; with STATIC_BUNDLES_ENABLED off
+# (the default under DEBUG) the source files are linked one by one.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'app.staticfiles.BundledManifestStorage'},
+}
+
+STATIC_BUNDLES = {
+    'base.css': ['css/layout/base.css'],
+    'base.js': ['js/ajax.js', 'js/suggest.js'],
+    'listing.css': ['css/index.css', 'css/layout/questions-answers.css', 'css/layout/paginator.css'],
+    'tag.css': ['css/layout/questions-answers.css', 'css/layout/paginator.css'],
+    'question.css': ['css/layout/questions-answers.css', 'css/question.css', 'css/layout/paginator.css'],
+    'forms.css': ['css/forms.css'],
+    'auth.css': ['css/forms.css', 'css/authorization.css'],
+    'upload.js': ['js/upload_photo.js'],
+}
+
+STATIC_BUNDLES_ENABLED = not DEBUG
+
+# Serve STATIC_ROOT from Django (precompressed, immutable Cache-Control for
+# hashed names) for deployments without a front proxy.
+STATIC_SERVE = True
+
+# app/async_views.py replaces the listing, question and vote views when
+# serving through web_project/asgi.py, which sets ASYNC_VIEWS=1 (see
+# gunicorn_asgi_config.py). Their independent queries run at the same time
+# on separate connections unless ASYNC_PARALLEL_QUERIES is off, from a pool
+# of ASYNC_QUERY_THREADS threads per process, each keeping its connection.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+ASYNC_PARALLEL_QUERIES = True
+
+ASYNC_QUERY_THREADS = 4
+
+# Listings use keyset (cursor) pagination; 'page' switches back to page
+# numbers with a total counted up to PAGINATION_COUNT_CAP rows.
+PAGINATION_MODE = 'cursor'
+
+PAGINATION_COUNT_CAP = 1000
+
+PAGINATION_COUNT_TIMEOUT = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,27 +14,50 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from app import async_views, avatars, staticfiles, views
 
-from app import views
+# ASYNC_VIEWS: served through web_project/asgi.py
+pages = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.index, name='index'),
-    path('hot', views.hot_questions, name='hot_questions'),
+    path('', pages.index, name='index'),
+    path('hot', pages.hot_questions, name='hot_questions'),
     path('ask', views.ask, name='ask'),
-    path('question/<int:pk>', views.question, name='question'),
-    path('tag/<int:pk>', views.tag, name='tag'),
+    path('question/<int:pk>', pages.question, name='question'),
+    path('tag/<int:pk>', pages.tag, name='tag'),
+    path('tag/<str:names>', views.tags, name='tags'),
+    path('search', views.search, name='search'),
+    path('suggest', views.suggest, name='suggest'),
     path('settings', views.settings, name='settings'),
     path('register', views.register, name='register'),
     path('login', views.login, name='login'),
     path('logout', views.logout, name='logout'),
-    path('vote/', views.vote, name='vote'),
+    path('vote/', pages.vote, name='vote'),
     path('correct/', views.mark_correct, name='mark_correct'),
 ]
 
+if getattr(settings, 'STATIC_SERVE', False):
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), staticfiles.serve),
+    ]
+
 if settings.DEBUG:
+    urlpatterns += [
+        # thumbnail names are content hashes, see app/avatars.py
+        re_path(
+            r'^%s(?P<path>%s/.*)$' % (re.escape(settings.MEDIA_URL.lstrip('/')), avatars.THUMBNAILS_DIR),
+            cache_control(max_age=365 * 24 * 3600, public=True, immutable=True)(serve),
+            {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file